@@ -1,13 +1,66 @@
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from typing import List, Dict, Optional
+from functools import lru_cache
+import asyncio
 import json
 import os
+import time
+from api.retry import RETRY_STATUS_CODES, MAX_ATTEMPTS, MAX_BACKOFF_SECONDS
 from config.settings import get_settings
 from utils.logger import logger
 
 settings = get_settings()
 
+_SCOPES = (
+    'https://spreadsheets.google.com/feeds',
+    'https://www.googleapis.com/auth/drive'
+)
+
+def _with_backoff(call, *args, **kwargs):
+    """Run a gspread call, retrying rate limits / server errors with backoff"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return call(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = e.response.status_code
+            if status not in RETRY_STATUS_CODES or attempt == MAX_ATTEMPTS:
+                raise
+
+            retry_after = e.response.headers.get("Retry-After")
+            try:
+                delay = min(float(retry_after), MAX_BACKOFF_SECONDS)
+            except (TypeError, ValueError):
+                delay = min(2.0 ** attempt, MAX_BACKOFF_SECONDS)
+
+            logger.warning(
+                f"Sheets request returned {status}, retrying in {delay:.1f}s "
+                f"(attempt {attempt}/{MAX_ATTEMPTS - 1})"
+            )
+            time.sleep(delay)
+
+@lru_cache(maxsize=1)
+def _authorize_client() -> gspread.Client:
+    """Authorize gspread once per process and reuse the client.
+
+    Credential creation hits Google's token endpoint, so caching the
+    authorized client avoids re-running the OAuth exchange every time a
+    GoogleSheetsAPI instance is built.
+    """
+    # Try from environment variable first (Railway)
+    creds_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
+
+    if creds_json:
+        creds_dict = json.loads(creds_json)
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, _SCOPES)
+    else:
+        # Fallback to file
+        creds = ServiceAccountCredentials.from_json_keyfile_name(
+            settings.GOOGLE_SHEETS_CREDENTIALS_FILE, _SCOPES
+        )
+
+    return gspread.authorize(creds)
+
 class GoogleSheetsAPI:
     """Google Sheets API Client"""
     
@@ -15,32 +68,20 @@ class GoogleSheetsAPI:
         self.spreadsheet_id = settings.GOOGLE_SHEETS_SPREADSHEET_ID
         self.client = None
         self.spreadsheet = None
+        # Diff state for the status sheet: sku -> sheet row number and
+        # sku -> hash of the last row written. Most hourly syncs change
+        # a handful of rows, so only those are pushed
+        self._row_index: Dict[str, int] = {}
+        self._row_hashes: Dict[str, int] = {}
         self._authenticate()
     
     def _authenticate(self):
         """Authenticate with Google Sheets"""
         try:
-            scope = [
-                'https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive'
-            ]
-            
-            # Try from environment variable first (Railway)
-            creds_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
-            
-            if creds_json:
-                creds_dict = json.loads(creds_json)
-                creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            else:
-                # Fallback to file
-                creds = ServiceAccountCredentials.from_json_keyfile_name(
-                    settings.GOOGLE_SHEETS_CREDENTIALS_FILE, scope
-                )
-            
-            self.client = gspread.authorize(creds)
+            self.client = _authorize_client()
             self.spreadsheet = self.client.open_by_key(self.spreadsheet_id)
             logger.info("Google Sheets authenticated successfully")
-            
+
         except Exception as e:
             logger.error(f"Failed to authenticate Google Sheets: {str(e)}")
     
@@ -52,71 +93,166 @@ class GoogleSheetsAPI:
             logger.info(f"Creating worksheet: {name}")
             return self.spreadsheet.add_worksheet(title=name, rows=1000, cols=20)
     
+    def batch_read(self, ranges: List[str]) -> Dict[str, List[List[str]]]:
+        """Read several ranges in a single values:batchGet request"""
+        try:
+            result = _with_backoff(self.spreadsheet.values_batch_get, ranges)
+            return {
+                value_range.get("range", ranges[i]): value_range.get("values", [])
+                for i, value_range in enumerate(result.get("valueRanges", []))
+            }
+        except Exception as e:
+            logger.error(f"Error batch reading ranges: {str(e)}")
+            return {}
+
     def read_products(self) -> List[Dict]:
         """Read products from 'productos' sheet"""
         try:
-            worksheet = self.get_worksheet("productos")
-            records = worksheet.get_all_records()
+            result = _with_backoff(
+                self.spreadsheet.values_get,
+                "productos!A:H",
+                params={
+                    "valueRenderOption": "UNFORMATTED_VALUE",
+                    "majorDimension": "ROWS"
+                }
+            )
+            rows = result.get("values", [])
+            if not rows:
+                return []
+
+            # First row is the header; build dicts without gspread's
+            # per-cell parsing overhead. The API omits trailing empty
+            # cells, so pad short rows to the header width.
+            headers, *data = rows
+            width = len(headers)
+            records = [
+                dict(zip(headers, row + [""] * (width - len(row))))
+                for row in data
+            ]
+
             logger.info(f"Read {len(records)} products from Google Sheets")
             return records
         except Exception as e:
             logger.error(f"Error reading products: {str(e)}")
             return []
     
+    @staticmethod
+    def _status_row(product: Dict) -> List:
+        """Sheet row for one product on the status sheet"""
+        return [
+            product.get("sku", ""),
+            product.get("name", ""),
+            product.get("status", ""),
+            product.get("score", 0),
+            product.get("ml_item_id", ""),
+            product.get("price", 0),
+            product.get("margin", 0),
+            product.get("updated_at", "")
+        ]
+
     def write_product_status(self, products: List[Dict]):
-        """Write product status to 'estado_productos' sheet"""
+        """Write product status to 'estado_productos' sheet.
+
+        Diffs against the rows written last time: unchanged rows are
+        skipped and changed/new rows go out in one batch update, so the
+        hourly sync costs one small request instead of a full-sheet
+        rewrite. Removed SKUs fall back to the full rewrite.
+        """
         try:
             worksheet = self.get_worksheet("estado_productos")
-            
-            # Clear existing data
-            worksheet.clear()
-            
-            # Headers
+
             headers = ["sku", "name", "status", "score", "ml_item_id", "price", "margin", "updated_at"]
-            worksheet.append_row(headers)
-            
-            # Data
-            for product in products:
-                row = [
-                    product.get("sku", ""),
-                    product.get("name", ""),
-                    product.get("status", ""),
-                    product.get("score", 0),
-                    product.get("ml_item_id", ""),
-                    product.get("price", 0),
-                    product.get("margin", 0),
-                    product.get("updated_at", "")
-                ]
-                worksheet.append_row(row)
-            
+            current = {p.get("sku", ""): self._status_row(p) for p in products}
+
+            if self._row_index and not (set(self._row_index) - set(current)):
+                data = []
+                for sku, row in current.items():
+                    row_hash = hash(tuple(map(str, row)))
+                    if self._row_hashes.get(sku) == row_hash:
+                        continue
+
+                    line = self._row_index.get(sku)
+                    if line is None:
+                        # New SKU: append below the known rows
+                        line = len(self._row_index) + 2
+                        self._row_index[sku] = line
+                    data.append({
+                        "range": f"estado_productos!A{line}:H{line}",
+                        "values": [row]
+                    })
+                    self._row_hashes[sku] = row_hash
+
+                if not data:
+                    logger.info("Product statuses unchanged, skipping sheet write")
+                    return
+
+                # Grow the grid if appends pushed past it
+                needed = len(self._row_index) + 1
+                if worksheet.row_count < needed:
+                    _with_backoff(worksheet.resize, rows=needed, cols=len(headers))
+
+                _with_backoff(self.spreadsheet.values_batch_update, {
+                    "valueInputOption": "RAW",
+                    "data": data
+                })
+
+                logger.info(f"Wrote {len(data)} changed product rows to Google Sheets")
+                return
+
+            # First sync or SKUs removed: rewrite the whole range and
+            # rebuild the diff state. Right-sizing the grid drops any
+            # stale rows and the batch update rewrites it in one request
+            rows = [headers] + list(current.values())
+
+            _with_backoff(worksheet.resize, rows=len(rows), cols=len(headers))
+            _with_backoff(self.spreadsheet.values_batch_update, {
+                "valueInputOption": "RAW",
+                "data": [{
+                    "range": f"estado_productos!A1:H{len(rows)}",
+                    "values": rows
+                }]
+            })
+
+            self._row_index = {
+                sku: line for line, sku in enumerate(current, start=2)
+            }
+            self._row_hashes = {
+                sku: hash(tuple(map(str, row))) for sku, row in current.items()
+            }
+
             logger.info(f"Wrote {len(products)} product statuses to Google Sheets")
-            
+
         except Exception as e:
             logger.error(f"Error writing product status: {str(e)}")
-    
+
     def write_actions(self, actions: List[Dict]):
         """Write actions to 'acciones' sheet"""
         try:
             worksheet = self.get_worksheet("acciones")
-            
+
+            rows = []
+
             # Headers (if empty)
             if worksheet.row_count == 0:
-                headers = ["date", "product_sku", "action_type", "reason", "success"]
-                worksheet.append_row(headers)
-            
-            # Data
-            for action in actions:
-                row = [
+                rows.append(["date", "product_sku", "action_type", "reason", "success"])
+
+            # Append all rows in a single API call
+            rows.extend(
+                [
                     action.get("created_at", ""),
                     action.get("product_sku", ""),
                     action.get("action_type", ""),
                     action.get("reason", ""),
                     str(action.get("success", True))
                 ]
-                worksheet.append_row(row)
-            
+                for action in actions
+            )
+
+            if rows:
+                _with_backoff(worksheet.append_rows, rows, value_input_option="RAW")
+
             logger.info(f"Wrote {len(actions)} actions to Google Sheets")
-            
+
         except Exception as e:
             logger.error(f"Error writing actions: {str(e)}")
     
@@ -129,9 +265,65 @@ class GoogleSheetsAPI:
         except Exception as e:
             logger.error(f"Error syncing to Google Sheets: {str(e)}")
 
+class SheetsSyncQueue:
+    """Coalesce sheet syncs through a background writer task.
+
+    Callers enqueue (products, actions) and return immediately; the
+    writer drains bursts after a short delay, keeps the last payload per
+    product SKU, and runs the blocking gspread sync in a worker thread.
+    """
+
+    def __init__(self, api: "GoogleSheetsAPI", interval: float = 5.0):
+        self.api = api
+        self.interval = interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        self._writer_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the writer task (must run inside the event loop)"""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        """Cancel the writer task"""
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+
+    async def enqueue(self, products: List[Dict], actions: List[Dict]):
+        """Queue a sync; returns without waiting for the write"""
+        await self._queue.put((products, actions))
+
+    async def _writer(self):
+        while True:
+            products, actions = await self._queue.get()
+
+            # Let a burst accumulate, then drain everything pending
+            await asyncio.sleep(self.interval)
+
+            by_sku = {p.get("sku"): p for p in products}
+            all_actions = list(actions)
+            while not self._queue.empty():
+                more_products, more_actions = self._queue.get_nowait()
+                by_sku.update((p.get("sku"), p) for p in more_products)
+                all_actions.extend(more_actions)
+
+            try:
+                await asyncio.to_thread(
+                    self.api.sync_all, list(by_sku.values()), all_actions
+                )
+            except Exception as e:
+                logger.error(f"Error in sheets writer task: {str(e)}")
+
 # Global instance
 try:
     sheets_api = GoogleSheetsAPI()
 except Exception as e:
     logger.warning(f"Google Sheets not initialized: {str(e)}")
     sheets_api = None
+
+sheets_queue = SheetsSyncQueue(sheets_api) if sheets_api else None
@@ -1,178 +1,344 @@
+import asyncio
 import httpx
+import orjson
+import time
 from typing import Optional, Dict, Any, List
+from api.retry import request_with_backoff
 from config.settings import get_settings
 from utils.logger import logger
 
 settings = get_settings()
 
+# Headers for unauthenticated public search
+_SEARCH_HEADERS = {
+    "User-Agent": "ML-Automation/1.0",
+    "Accept": "application/json"
+}
+
+class _TTLCache:
+    """Minimal TTL cache for read-mostly API responses"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: Dict[Any, Any] = {}
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        timestamp, value = entry
+        if time.time() - timestamp > self.ttl:
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.time(), value)
+
 class MercadoLibreAPI:
     """Mercado Libre API Client"""
-    
-    def __init__(self):
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.base_url = "https://api.mercadolibre.com"
         self.access_token = settings.ML_ACCESS_TOKEN
         self.user_id = settings.ML_USER_ID
         self.country = settings.ML_COUNTRY
-        
-    def _get_headers(self) -> Dict[str, str]:
-        """Get request headers"""
+        # Unix timestamp after which the current token must be refreshed
+        self._token_expires_at = 0.0
+        # Read-mostly endpoints: search answers are stable for about an
+        # hour, category attributes for a day
+        self._search_cache = _TTLCache(ttl=3600)
+        self._attributes_cache = _TTLCache(ttl=86400)
+        self._fees_cache = _TTLCache(ttl=3600)
+        # Header dict is rebuilt only when the token changes
+        self._headers = self._build_headers()
+        # One pooled client for all calls: keep-alive + HTTP/2 avoid a
+        # TCP+TLS handshake per request. An injected client (shared app
+        # pool) is not closed by aclose(); _request builds absolute
+        # URLs, so no base_url is required on it
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            timeout=10.0
+        )
+
+    def _build_headers(self) -> Dict[str, str]:
+        """Build auth headers for the current token"""
         return {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
-    
+
+    def _get_headers(self) -> Dict[str, str]:
+        """Get request headers"""
+        return self._headers
+
+    async def aclose(self):
+        """Close the underlying HTTP client (call on shutdown)"""
+        if self._owns_client:
+            await self._client.aclose()
+
+    def needs_refresh(self, margin: float = 600.0) -> bool:
+        """Whether the token is unknown or expires within margin seconds"""
+        return time.time() >= self._token_expires_at - margin
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Issue a request through the shared retry-with-backoff helper.
+
+        url is a path; the absolute URL is built here so the same call
+        works on the owned client and on an injected one, which has no
+        ML base_url configured.
+
+        A 401 on an authenticated call means the token died early
+        (revoked, or expired between refresh ticks): refresh once and
+        replay with the new header instead of failing every call until
+        the next scheduled refresh.
+        """
+        full_url = f"{self.base_url}{url}"
+        response = await request_with_backoff(
+            self._client, method, full_url, service="ML", **kwargs
+        )
+
+        if (response.status_code == 401
+                and url != "/oauth/token"
+                and "Authorization" in kwargs.get("headers", {})):
+            logger.warning(f"ML returned 401 for {method} {url}, refreshing token")
+            self._token_expires_at = 0.0
+            if await self.refresh_token():
+                kwargs["headers"] = self._get_headers()
+                response = await request_with_backoff(
+                    self._client, method, full_url, service="ML", **kwargs
+                )
+
+        return response
+
     async def refresh_token(self) -> bool:
-        """Refresh access token"""
+        """Refresh access token (no-op while the cached token is still valid)"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/oauth/token",
-                    data={
-                        "grant_type": "refresh_token",
-                        "client_id": settings.ML_APP_ID,
-                        "client_secret": settings.ML_SECRET_KEY,
-                        "refresh_token": settings.ML_REFRESH_TOKEN
-                    }
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    self.access_token = data["access_token"]
-                    logger.info("ML access token refreshed")
-                    return True
-                else:
-                    logger.error(f"Failed to refresh token: {response.text}")
-                    return False
-                    
+            # Skip the token endpoint while the current token has >60s left
+            if time.time() < self._token_expires_at - 60:
+                return True
+
+            response = await self._request(
+                "POST", "/oauth/token",
+                data={
+                    "grant_type": "refresh_token",
+                    "client_id": settings.ML_APP_ID,
+                    "client_secret": settings.ML_SECRET_KEY,
+                    "refresh_token": settings.ML_REFRESH_TOKEN
+                }
+            )
+
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                self.access_token = data["access_token"]
+                self._token_expires_at = time.time() + data.get("expires_in", 21600)
+                self._headers = self._build_headers()
+                logger.info("ML access token refreshed")
+                return True
+            else:
+                logger.error(f"Failed to refresh token: {response.text}")
+                return False
+
         except Exception as e:
             logger.error(f"Error refreshing token: {str(e)}")
             return False
-    
+
     async def search_items(self, query: str, limit: int = 20) -> List[Dict]:
-    """Search items in ML - Public search without authentication"""
-    try:
-        headers = {
-            "User-Agent": "ML-Automation/1.0",
-            "Accept": "application/json"
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/sites/{self.country}/search",
+        """Search items in ML - Public search without authentication"""
+        cached = self._search_cache.get((query, limit))
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self._request(
+                "GET", f"/sites/{self.country}/search",
                 params={"q": query, "limit": limit},
-                headers=headers,
-                timeout=10.0
+                headers=_SEARCH_HEADERS
             )
-                
-                if response.status_code == 200:
-                    return response.json().get("results", [])
-                else:
-                    logger.error(f"Search failed: {response.text}")
-                    return []
-                    
+
+            if response.status_code == 200:
+                results = orjson.loads(response.content).get("results", [])
+                self._search_cache.set((query, limit), results)
+                return results
+            else:
+                logger.error(f"Search failed: {response.text}")
+                return []
+
         except Exception as e:
             logger.error(f"Error searching items: {str(e)}")
             return []
-    
+
+    async def get_seller_items(self, offset: int = 0, limit: int = 50) -> Optional[Dict]:
+        """Get a page of the seller's item ids.
+
+        Returns the raw response ({"results": [ids], "paging": {...}})
+        so callers can read paging.total and fan out remaining pages.
+        """
+        try:
+            response = await self._request(
+                "GET", f"/users/{self.user_id}/items/search",
+                params={"offset": offset, "limit": limit},
+                headers=self._get_headers()
+            )
+
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+            else:
+                logger.error(f"Get seller items failed: {response.text}")
+                return None
+
+        except Exception as e:
+            logger.error(f"Error getting seller items: {str(e)}")
+            return None
+
     async def get_item(self, item_id: str) -> Optional[Dict]:
         """Get item details"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/items/{item_id}",
-                    headers=self._get_headers()
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Get item failed: {response.text}")
-                    return None
-                    
+            response = await self._request(
+                "GET", f"/items/{item_id}",
+                headers=self._get_headers()
+            )
+
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+            else:
+                logger.error(f"Get item failed: {response.text}")
+                return None
+
         except Exception as e:
             logger.error(f"Error getting item: {str(e)}")
             return None
-    
+
     async def create_item(self, item_data: Dict) -> Optional[Dict]:
         """Create new item"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/items",
-                    headers=self._get_headers(),
-                    json=item_data
-                )
-                
-                if response.status_code == 201:
-                    logger.info(f"Item created: {response.json()['id']}")
-                    return response.json()
-                else:
-                    logger.error(f"Create item failed: {response.text}")
-                    return None
-                    
+            response = await self._request(
+                "POST", "/items",
+                headers=self._get_headers(),
+                content=orjson.dumps(item_data)
+            )
+
+            if response.status_code == 201:
+                data = orjson.loads(response.content)
+                logger.info(f"Item created: {data['id']}")
+                return data
+            else:
+                logger.error(f"Create item failed: {response.text}")
+                return None
+
         except Exception as e:
             logger.error(f"Error creating item: {str(e)}")
             return None
-    
+
     async def update_item(self, item_id: str, updates: Dict) -> bool:
         """Update item"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.put(
-                    f"{self.base_url}/items/{item_id}",
-                    headers=self._get_headers(),
-                    json=updates
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Item updated: {item_id}")
-                    return True
-                else:
-                    logger.error(f"Update item failed: {response.text}")
-                    return False
-                    
+            response = await self._request(
+                "PUT", f"/items/{item_id}",
+                headers=self._get_headers(),
+                content=orjson.dumps(updates)
+            )
+
+            if response.status_code == 200:
+                logger.info(f"Item updated: {item_id}")
+                return True
+            else:
+                logger.error(f"Update item failed: {response.text}")
+                return False
+
         except Exception as e:
             logger.error(f"Error updating item: {str(e)}")
             return False
-    
+
+    async def update_items_bulk(self, updates: List[tuple]) -> List[bool]:
+        """Update many items concurrently over the pooled client.
+
+        updates is a list of (item_id, payload) pairs; returns one bool
+        per pair in the same order.
+        """
+        if not updates:
+            return []
+
+        sem = asyncio.Semaphore(settings.ML_CONCURRENCY)
+
+        async def update_one(item_id: str, payload: Dict) -> bool:
+            async with sem:
+                return await self.update_item(item_id, payload)
+
+        return await asyncio.gather(
+            *[update_one(item_id, payload) for item_id, payload in updates]
+        )
+
+    async def prefetch_categories(self, category_ids: List[str],
+                                  price: float = 0.0) -> None:
+        """Fetch attributes + listing fees for many categories concurrently.
+
+        Call this once before iterating products so per-product lookups
+        hit the cache instead of issuing 2 serialized requests each.
+        """
+        unique = [
+            cid for cid in dict.fromkeys(category_ids)
+            if cid and self._attributes_cache.get(cid) is None
+        ]
+        if not unique:
+            return
+
+        # The fetches below populate the TTL caches as a side effect
+        await asyncio.gather(
+            *[self.get_category_attributes(cid) for cid in unique],
+            *[self.get_listing_fees(cid, price) for cid in unique]
+        )
+
     async def get_category_attributes(self, category_id: str) -> List[Dict]:
         """Get required attributes for category"""
+        cached = self._attributes_cache.get(category_id)
+        if cached is not None:
+            return cached
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/categories/{category_id}/attributes"
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Get attributes failed: {response.text}")
-                    return []
-                    
+            response = await self._request(
+                "GET", f"/categories/{category_id}/attributes"
+            )
+
+            if response.status_code == 200:
+                attributes = orjson.loads(response.content)
+                self._attributes_cache.set(category_id, attributes)
+                return attributes
+            else:
+                logger.error(f"Get attributes failed: {response.text}")
+                return []
+
         except Exception as e:
             logger.error(f"Error getting attributes: {str(e)}")
             return []
-    
-    async def get_listing_fees(self, category_id: str, price: float, 
+
+    async def get_listing_fees(self, category_id: str, price: float,
                                listing_type: str = "gold_special") -> Optional[Dict]:
         """Calculate listing fees"""
+        cached = self._fees_cache.get((category_id, price, listing_type))
+        if cached is not None:
+            return cached
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/sites/{self.country}/listing_prices",
-                    params={
-                        "category_id": category_id,
-                        "price": price,
-                        "listing_type_id": listing_type
-                    }
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.warning(f"Get fees failed: {response.text}")
-                    return None
-                    
+            response = await self._request(
+                "GET", f"/sites/{self.country}/listing_prices",
+                params={
+                    "category_id": category_id,
+                    "price": price,
+                    "listing_type_id": listing_type
+                }
+            )
+
+            if response.status_code == 200:
+                fees = orjson.loads(response.content)
+                self._fees_cache.set((category_id, price, listing_type), fees)
+                return fees
+            else:
+                logger.warning(f"Get fees failed: {response.text}")
+                return None
+
         except Exception as e:
             logger.error(f"Error getting fees: {str(e)}")
             return None
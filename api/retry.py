@@ -0,0 +1,53 @@
+"""Shared retry/backoff helpers for the HTTP API clients"""
+import asyncio
+import httpx
+from config.settings import get_settings
+from utils.logger import logger
+
+settings = get_settings()
+
+# Transient statuses worth retrying (rate limits and server errors)
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+MAX_ATTEMPTS = 5
+MAX_BACKOFF_SECONDS = 30.0
+
+# Process-wide cap on in-flight outbound requests, shared by the ML and
+# Shopify clients. The per-batch ML_CONCURRENCY semaphores bound each
+# fan-out individually; this one bounds their sum, so two jobs fanning
+# out at once cannot stack into an unbounded burst
+_http_semaphore = asyncio.Semaphore(settings.HTTP_CONCURRENCY)
+
+def backoff_delay(response, attempt: int) -> float:
+    """Delay before the next attempt, honoring Retry-After when present"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    return min(2.0 ** attempt, MAX_BACKOFF_SECONDS)
+
+async def request_with_backoff(client: httpx.AsyncClient, method: str, url: str,
+                               service: str = "API", **kwargs) -> httpx.Response:
+    """Issue a request, retrying rate limits / server errors with backoff.
+
+    Every attempt passes through the shared semaphore, so retries count
+    against the same process-wide in-flight budget as fresh requests.
+    The backoff sleeps happen outside it to avoid parking a slot idle.
+    """
+    async with _http_semaphore:
+        response = await client.request(method, url, **kwargs)
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        if response.status_code not in RETRY_STATUS_CODES:
+            break
+        delay = backoff_delay(response, attempt)
+        logger.warning(
+            f"{service} request {method} {url} returned {response.status_code}, "
+            f"retrying in {delay:.1f}s (attempt {attempt}/{MAX_ATTEMPTS - 1})"
+        )
+        await asyncio.sleep(delay)
+        async with _http_semaphore:
+            response = await client.request(method, url, **kwargs)
+
+    return response
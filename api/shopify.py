@@ -1,5 +1,8 @@
+import asyncio
 import httpx
+import orjson
 from typing import Optional, Dict, List
+from api.retry import request_with_backoff
 from config.settings import get_settings
 from utils.logger import logger
 
@@ -7,101 +10,172 @@ settings = get_settings()
 
 class ShopifyAPI:
     """Shopify API Client"""
-    
-    def __init__(self):
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.shop_url = settings.SHOPIFY_SHOP_URL
         self.access_token = settings.SHOPIFY_ACCESS_TOKEN
         self.api_version = settings.SHOPIFY_API_VERSION
         self.base_url = f"https://{self.shop_url}/admin/api/{self.api_version}"
-        
+        # Auth headers go on every request (not baked into the client)
+        # so an injected client authenticates the same as the owned one
+        self._headers = self._get_headers()
+        # One pooled client for all calls: keep-alive + HTTP/2 avoid a
+        # TCP+TLS handshake per request. An injected client (shared app
+        # pool) is not closed by aclose()
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            timeout=10.0
+        )
+
     def _get_headers(self) -> Dict[str, str]:
         """Get request headers"""
         return {
             "X-Shopify-Access-Token": self.access_token,
             "Content-Type": "application/json"
         }
-    
-    async def get_products(self, limit: int = 50) -> List[Dict]:
-        """Get products from Shopify"""
+
+    async def aclose(self):
+        """Close the underlying HTTP client (call on shutdown)"""
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Issue a request through the shared retry-with-backoff helper"""
+        kwargs.setdefault("headers", self._headers)
+        return await request_with_backoff(
+            self._client, method, url, service="Shopify", **kwargs
+        )
+
+    async def get_products(self, limit: int = 50,
+                           fields: Optional[str] = None) -> List[Dict]:
+        """Get products from Shopify.
+
+        Pass fields (e.g. "id,variants") to request a sparse fieldset
+        and avoid pulling the full product payload.
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/products.json",
-                    headers=self._get_headers(),
-                    params={"limit": limit}
-                )
-                
-                if response.status_code == 200:
-                    return response.json().get("products", [])
-                else:
-                    logger.error(f"Get products failed: {response.text}")
-                    return []
-                    
+            params = {"limit": limit}
+            if fields:
+                params["fields"] = fields
+
+            response = await self._request(
+                "GET", f"{self.base_url}/products.json",
+                params=params
+            )
+
+            if response.status_code == 200:
+                return orjson.loads(response.content).get("products", [])
+            else:
+                logger.error(f"Get products failed: {response.text}")
+                return []
+
         except Exception as e:
             logger.error(f"Error getting products: {str(e)}")
             return []
-    
-    async def get_product(self, product_id: str) -> Optional[Dict]:
-        """Get single product"""
+
+    async def get_product(self, product_id: str,
+                          fields: Optional[str] = None) -> Optional[Dict]:
+        """Get single product (optionally restricted to a sparse fieldset)"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/products/{product_id}.json",
-                    headers=self._get_headers()
-                )
-                
-                if response.status_code == 200:
-                    return response.json().get("product")
-                else:
-                    logger.error(f"Get product failed: {response.text}")
-                    return None
-                    
+            params = {"fields": fields} if fields else None
+
+            response = await self._request(
+                "GET", f"{self.base_url}/products/{product_id}.json",
+                params=params
+            )
+
+            if response.status_code == 200:
+                return orjson.loads(response.content).get("product")
+            else:
+                logger.error(f"Get product failed: {response.text}")
+                return None
+
         except Exception as e:
             logger.error(f"Error getting product: {str(e)}")
             return None
-    
-    async def update_inventory(self, inventory_item_id: str, 
+
+    async def get_inventory_bulk(self, product_ids: List[str]) -> Dict[str, int]:
+        """Get first-variant stock for many products in few requests.
+
+        Uses the products.json?ids= endpoint (up to 250 ids per call)
+        with a sparse fieldset, returning {product_id: stock}. Pages
+        are fetched concurrently, so catalogs beyond one page cost one
+        round trip of wall time instead of one per 250 products.
+        """
+        stock: Dict[str, int] = {}
+
+        async def fetch_page(chunk: List[str]) -> None:
+            response = await self._request(
+                "GET", f"{self.base_url}/products.json",
+                params={
+                    "ids": ",".join(chunk),
+                    "fields": "id,variants",
+                    "limit": 250
+                }
+            )
+
+            if response.status_code != 200:
+                logger.error(f"Bulk inventory fetch failed: {response.text}")
+                return
+
+            for product in orjson.loads(response.content).get("products", []):
+                variants = product.get("variants") or []
+                if variants:
+                    stock[str(product["id"])] = variants[0].get(
+                        "inventory_quantity", 0
+                    )
+
+        try:
+            await asyncio.gather(*[
+                fetch_page(product_ids[start:start + 250])
+                for start in range(0, len(product_ids), 250)
+            ])
+            return stock
+
+        except Exception as e:
+            logger.error(f"Error fetching bulk inventory: {str(e)}")
+            return stock
+
+    async def update_inventory(self, inventory_item_id: str,
                               location_id: str, available: int) -> bool:
         """Update inventory quantity"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/inventory_levels/set.json",
-                    headers=self._get_headers(),
-                    json={
-                        "location_id": location_id,
-                        "inventory_item_id": inventory_item_id,
-                        "available": available
-                    }
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Inventory updated: {inventory_item_id} = {available}")
-                    return True
-                else:
-                    logger.error(f"Update inventory failed: {response.text}")
-                    return False
-                    
+            response = await self._request(
+                "POST", f"{self.base_url}/inventory_levels/set.json",
+                content=orjson.dumps({
+                    "location_id": location_id,
+                    "inventory_item_id": inventory_item_id,
+                    "available": available
+                })
+            )
+
+            if response.status_code == 200:
+                logger.info(f"Inventory updated: {inventory_item_id} = {available}")
+                return True
+            else:
+                logger.error(f"Update inventory failed: {response.text}")
+                return False
+
         except Exception as e:
             logger.error(f"Error updating inventory: {str(e)}")
             return False
-    
+
     async def get_inventory_levels(self, inventory_item_ids: List[str]) -> List[Dict]:
         """Get inventory levels"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/inventory_levels.json",
-                    headers=self._get_headers(),
-                    params={"inventory_item_ids": ",".join(inventory_item_ids)}
-                )
-                
-                if response.status_code == 200:
-                    return response.json().get("inventory_levels", [])
-                else:
-                    logger.error(f"Get inventory failed: {response.text}")
-                    return []
-                    
+            response = await self._request(
+                "GET", f"{self.base_url}/inventory_levels.json",
+                params={"inventory_item_ids": ",".join(inventory_item_ids)}
+            )
+
+            if response.status_code == 200:
+                return orjson.loads(response.content).get("inventory_levels", [])
+            else:
+                logger.error(f"Get inventory failed: {response.text}")
+                return []
+
         except Exception as e:
             logger.error(f"Error getting inventory: {str(e)}")
             return []
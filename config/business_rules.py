@@ -37,3 +37,6 @@ AB_TEST_MIN_SALES = 5
 
 # OPTIMIZACIÓN DE PRECIOS
 PRICE_REDUCTION_PERCENTAGE = 7.0
+
+# CONCURRENCIA
+OPTIMIZE_CONCURRENCY = 20
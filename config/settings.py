@@ -1,7 +1,15 @@
-from pydantic_settings import BaseSettings
+from dataclasses import dataclass
 from functools import lru_cache
+import os
 
-class Settings(BaseSettings):
+from dotenv import load_dotenv
+
+# Load .env once at import; os.environ wins over file values
+if os.path.exists(".env"):
+    load_dotenv()
+
+@dataclass(slots=True, frozen=True)
+class Settings:
     # Mercado Libre
     ML_APP_ID: str = ""
     ML_SECRET_KEY: str = ""
@@ -9,36 +17,58 @@ class Settings(BaseSettings):
     ML_REFRESH_TOKEN: str = ""
     ML_USER_ID: str = ""
     ML_COUNTRY: str = "MLM"
-    
+
     # Shopify
     SHOPIFY_SHOP_URL: str = ""
     SHOPIFY_ACCESS_TOKEN: str = ""
     SHOPIFY_API_VERSION: str = "2024-01"
-    
+
     # Google Sheets
     GOOGLE_SHEETS_CREDENTIALS_FILE: str = "credentials.json"
     GOOGLE_SHEETS_SPREADSHEET_ID: str = ""
-    
+
     # Email
     SMTP_HOST: str = "smtp.gmail.com"
     SMTP_PORT: int = 587
     SMTP_USER: str = ""
     SMTP_PASSWORD: str = ""
     NOTIFICATION_EMAIL: str = ""
-    
+
     # Database
     DATABASE_URL: str = "sqlite:///./ml_automation.db"
-    
+
+    # Concurrency
+    ML_CONCURRENCY: int = 10
+    HTTP_CONCURRENCY: int = 20
+
+    # Debugging (enables SQL query accounting)
+    DEBUG: bool = False
+
     # Business Rules
     MIN_MARGIN_PERCENTAGE: float = 30.0
     AUTO_PUBLISH_SCORE_THRESHOLD: int = 80
     TEST_AB_DURATION_DAYS: int = 7
     PAUSE_NO_SALES_DAYS: int = 14
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
-
-@lru_cache()
-def get_settings():
-    return Settings()
+
+    @classmethod
+    def load(cls) -> "Settings":
+        """Build settings from os.environ, falling back to the defaults"""
+        env = os.environ
+        kwargs = {}
+        for name, field_type in cls.__annotations__.items():
+            raw = env.get(name)
+            if raw is None:
+                continue
+            if field_type is int:
+                kwargs[name] = int(raw)
+            elif field_type is float:
+                kwargs[name] = float(raw)
+            elif field_type is bool:
+                kwargs[name] = raw.lower() in ("1", "true", "yes")
+            else:
+                kwargs[name] = raw
+        return cls(**kwargs)
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings.load()
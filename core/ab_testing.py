@@ -1,17 +1,49 @@
-from typing import Dict, Optional
-from sqlalchemy.orm import Session
-from database.models import ABTest, Listing, Product
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from database.models import ABTest, Listing, ListingMetrics, Product
 from datetime import datetime, timedelta
 from config import business_rules
 from utils.logger import logger
 from utils.notifications import notify_ab_test_completed
 
+# A variant must beat the other by 10% on a metric to win it
+_WINNER_THRESHOLD = 1.1
+
+# Compared in priority order: conversion first, then sales, then revenue
+_WINNER_METRICS = ("conversion_rate", "sales", "revenue")
+
+def bulk_sum_metrics(db: Session, listing_ids: List[int]) -> Dict[int, tuple]:
+    """Sum visits/sales/revenue for many listings in one GROUP BY query.
+
+    Returns {listing_id: (visits, sales, revenue)}; listings with no
+    metric rows are absent. This aggregates the full history, so it is
+    the reference for the denormalized totals kept on Listing.
+    """
+    rows = db.query(
+        ListingMetrics.listing_id,
+        func.coalesce(func.sum(ListingMetrics.visits), 0),
+        func.coalesce(func.sum(ListingMetrics.sales), 0),
+        func.coalesce(func.sum(ListingMetrics.revenue), 0)
+    ).filter(
+        ListingMetrics.listing_id.in_(listing_ids)
+    ).group_by(ListingMetrics.listing_id).all()
+
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
 class ABTestManager:
     """Manage A/B tests for listings"""
     
     def __init__(self, db: Session):
         self.db = db
-    
+        # When True, _evaluate leaves changes in the session and the
+        # batch sweep commits once at the end
+        self._defer_commit = False
+
+    def _commit(self):
+        if not self._defer_commit:
+            self.db.commit()
+
     def create_test(self, product_id: int, test_type: str,
                    variant_a_data: Dict, variant_b_data: Dict) -> Optional[ABTest]:
         """
@@ -20,7 +52,7 @@ class ABTestManager:
         test_type: price, title, description, combined
         """
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
+            product = self.db.get(Product, product_id)
             if not product:
                 return None
             
@@ -74,28 +106,65 @@ class ABTestManager:
     def evaluate_test(self, test_id: int) -> Optional[str]:
         """
         Evaluate A/B test and determine winner
-        
+
         Returns:
             Winner variant: "A", "B", or "tie"
         """
+        # One JOINed query loads the test with both variants and the
+        # product instead of four sequential SELECTs
+        test = self.db.query(ABTest).options(
+            joinedload(ABTest.variant_a),
+            joinedload(ABTest.variant_b),
+            joinedload(ABTest.product)
+        ).filter(ABTest.id == test_id).first()
+
+        return self._evaluate(test)
+
+    def evaluate_all_running_tests(self) -> Dict[int, Optional[str]]:
+        """Evaluate every running test, eager-loading in one sweep"""
+        tests = self.db.query(ABTest).options(
+            joinedload(ABTest.variant_a),
+            joinedload(ABTest.variant_b),
+            joinedload(ABTest.product)
+        ).filter(ABTest.status == "running").all()
+
+        # One timestamp shared across the whole sweep
+        now = datetime.utcnow()
+
+        # Accumulate all updates and fsync once instead of per test
+        self._defer_commit = True
+        try:
+            results = {test.id: self._evaluate(test, now) for test in tests}
+            self.db.commit()
+        finally:
+            self._defer_commit = False
+
+        return results
+
+    def _evaluate(self, test: Optional[ABTest],
+                  now: Optional[datetime] = None) -> Optional[str]:
+        """Evaluate an already-loaded test and determine the winner"""
         try:
-            test = self.db.query(ABTest).filter(ABTest.id == test_id).first()
             if not test or test.status != "running":
                 return None
-            
+
+            test_id = test.id
+            if now is None:
+                now = datetime.utcnow()
+
             # Check if enough time has passed
-            duration = datetime.utcnow() - test.started_at
+            duration = now - test.started_at
             if duration < timedelta(days=business_rules.AB_TEST_DURATION_DAYS):
                 logger.info(f"Test {test_id} not ready yet")
                 return None
-            
+
             # Get listings
-            listing_a = self.db.query(Listing).filter(Listing.id == test.variant_a_id).first()
-            listing_b = self.db.query(Listing).filter(Listing.id == test.variant_b_id).first()
-            
+            listing_a = test.variant_a
+            listing_b = test.variant_b
+
             if not listing_a or not listing_b:
                 return None
-            
+
             # Calculate metrics for each variant
             metrics_a = self._calculate_metrics(listing_a)
             metrics_b = self._calculate_metrics(listing_b)
@@ -118,7 +187,7 @@ class ABTestManager:
             # Update test
             test.status = "completed"
             test.winner = winner
-            test.ended_at = datetime.utcnow()
+            test.ended_at = now
             test.results = {
                 "variant_a": metrics_a,
                 "variant_b": metrics_b,
@@ -128,15 +197,15 @@ class ABTestManager:
             # Pause losing variant
             if winner == "A":
                 listing_b.status = "paused"
-                listing_b.ended_at = datetime.utcnow()
+                listing_b.ended_at = now
             elif winner == "B":
                 listing_a.status = "paused"
-                listing_a.ended_at = datetime.utcnow()
-            
-            self.db.commit()
+                listing_a.ended_at = now
+
+            self._commit()
             
             # Notify
-            product = self.db.query(Product).filter(Product.id == test.product_id).first()
+            product = test.product
             if product:
                 notify_ab_test_completed(product.name, winner, test.results)
             
@@ -147,18 +216,63 @@ class ABTestManager:
             logger.error(f"Error evaluating test: {str(e)}")
             return None
     
+    def record_metrics(self, listing: Listing, visits: int = 0,
+                       sales: int = 0, revenue: float = 0) -> None:
+        """Record a daily metrics row and bump the listing's running totals.
+
+        Both writes happen in one transaction so the denormalized
+        totals on Listing never drift from the history.
+        """
+        try:
+            self.db.add(ListingMetrics(
+                listing_id=listing.id,
+                visits=visits,
+                sales=sales,
+                revenue=revenue
+            ))
+            listing.total_visits = (listing.total_visits or 0) + visits
+            listing.total_sales = (listing.total_sales or 0) + sales
+            listing.total_revenue = (listing.total_revenue or 0) + revenue
+            self.db.commit()
+
+        except Exception as e:
+            logger.error(f"Error recording listing metrics: {str(e)}")
+            self.db.rollback()
+
+    def resync_listing_totals(self, listing_ids: List[int]) -> int:
+        """Rebuild denormalized listing totals from the metrics history.
+
+        One GROUP BY aggregate plus one IN() load, regardless of how
+        many metric rows exist. Returns the number of listings updated.
+        """
+        try:
+            totals = bulk_sum_metrics(self.db, listing_ids)
+            listings = self.db.query(Listing).filter(
+                Listing.id.in_(listing_ids)
+            ).all()
+
+            for listing in listings:
+                visits, sales, revenue = totals.get(listing.id, (0, 0, 0))
+                listing.total_visits = visits
+                listing.total_sales = sales
+                listing.total_revenue = revenue
+
+            self.db.commit()
+            return len(listings)
+
+        except Exception as e:
+            logger.error(f"Error resyncing listing totals: {str(e)}")
+            self.db.rollback()
+            return 0
+
     def _calculate_metrics(self, listing: Listing) -> Dict:
         """Calculate metrics for a listing"""
-        from database.models import ListingMetrics
-        
-        metrics = self.db.query(ListingMetrics).filter(
-            ListingMetrics.listing_id == listing.id
-        ).all()
-        
-        total_visits = sum(m.visits for m in metrics)
-        total_sales = sum(m.sales for m in metrics)
-        total_revenue = sum(m.revenue for m in metrics)
-        
+        # The running totals are maintained by record_metrics, so this
+        # is a plain attribute read instead of aggregating the history
+        total_visits = listing.total_visits or 0
+        total_sales = listing.total_sales or 0
+        total_revenue = listing.total_revenue or 0
+
         conversion_rate = (total_sales / total_visits * 100) if total_visits > 0 else 0
         
         return {
@@ -170,28 +284,16 @@ class ABTestManager:
     
     def _determine_winner(self, metrics_a: Dict, metrics_b: Dict) -> str:
         """Determine winner based on metrics"""
-        
-        # Compare conversion rates (most important)
-        conv_a = metrics_a["conversion_rate"]
-        conv_b = metrics_b["conversion_rate"]
-        
-        # Need at least 10% difference to declare winner
-        if conv_a > conv_b * 1.1:
-            return "A"
-        elif conv_b > conv_a * 1.1:
-            return "B"
-        
-        # If conversion rates are similar, compare sales
-        if metrics_a["sales"] > metrics_b["sales"] * 1.1:
-            return "A"
-        elif metrics_b["sales"] > metrics_a["sales"] * 1.1:
-            return "B"
-        
-        # If sales are similar, compare revenue
-        if metrics_a["revenue"] > metrics_b["revenue"] * 1.1:
-            return "A"
-        elif metrics_b["revenue"] > metrics_a["revenue"] * 1.1:
-            return "B"
-        
+
+        # Walk the metrics in priority order; the first one where a
+        # variant leads by the threshold decides the test
+        for key in _WINNER_METRICS:
+            a = metrics_a[key]
+            b = metrics_b[key]
+            if a > b * _WINNER_THRESHOLD:
+                return "A"
+            if b > a * _WINNER_THRESHOLD:
+                return "B"
+
         # Too close to call
         return "tie"
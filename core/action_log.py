@@ -0,0 +1,87 @@
+from typing import Dict, List
+from database.db import SessionLocal
+from database.models import ActionLog
+from utils.logger import logger
+import asyncio
+
+class ActionLogBatcher:
+    """Background writer that batches ActionLog inserts.
+
+    Callers enqueue plain dicts; a task drains the queue every
+    interval (or up to max_batch rows) and inserts the whole batch in
+    one transaction, so hot paths never pay a commit per log row.
+    """
+
+    def __init__(self, max_batch: int = 500, interval: float = 0.2):
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=10_000)
+        self._task = None
+        self._running = False
+
+    def start(self):
+        """Start the background writer (call from app startup)"""
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        """Flush pending rows and stop the writer (call on shutdown)"""
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self._flush, self._drain())
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def enqueue(self, row: Dict) -> bool:
+        """Queue one action row; returns False if the buffer is full"""
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Action log queue full, dropping entry")
+            return False
+
+    def _drain(self) -> List[Dict]:
+        rows = []
+        while len(rows) < self.max_batch:
+            try:
+                rows.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return rows
+
+    def _flush(self, rows: List[Dict]):
+        """Insert a batch of rows in one transaction (blocking)"""
+        if not rows:
+            return
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(ActionLog, rows)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error flushing action logs: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    async def _writer(self):
+        while True:
+            # Block until there is something to write, then give the
+            # burst a moment to accumulate
+            first = await self._queue.get()
+            await asyncio.sleep(self.interval)
+
+            rows = [first] + self._drain()
+            await asyncio.to_thread(self._flush, rows)
+
+# Global instance, started from the app lifespan
+action_log_batcher = ActionLogBatcher()
@@ -3,7 +3,32 @@ from api.mercadolibre import ml_api
 from database.models import CompetitorAnalysis
 from sqlalchemy.orm import Session
 from utils.logger import logger
-import statistics
+import numpy as np
+import time
+
+# Latest-analysis cache: competitor data changes on the order of hours,
+# so a short TTL saves one DB round-trip per product during sweeps
+_LATEST_TTL = 900.0
+_latest_cache: Dict[int, tuple] = {}
+
+def classify_competition(n_items, variance_pct):
+    """Classify competition level from result count and price variance.
+
+    Scalars take a plain fast path; NumPy arrays are classified in one
+    np.select pass, ready for batch multi-keyword analysis.
+    """
+    if np.ndim(n_items) == 0:
+        if n_items < 10:
+            return "low"
+        if n_items < 50 and variance_pct > 20:
+            return "medium"
+        return "high"
+
+    return np.select(
+        [n_items < 10, (n_items < 50) & (variance_pct > 20)],
+        ["low", "medium"],
+        default="high"
+    )
 
 class CompetitorAnalyzer:
     """Analyze competition on Mercado Libre"""
@@ -33,42 +58,44 @@ class CompetitorAnalyzer:
             free_shipping_count = 0
             top_competitors = []
             
+            # Single pass: read each item's fields once instead of
+            # repeating the price/shipping dict lookups
             for item in items[:10]:  # Top 10
                 price = item.get("price", 0)
+                shipping = item.get("shipping") or {}
+                free_shipping = shipping.get("free_shipping", False)
+
                 if price > 0:
                     prices.append(price)
-                
-                if item.get("shipping", {}).get("free_shipping"):
+
+                if free_shipping:
                     free_shipping_count += 1
-                
+
                 top_competitors.append({
                     "id": item.get("id"),
                     "title": item.get("title"),
                     "price": price,
                     "sold_quantity": item.get("sold_quantity", 0),
-                    "free_shipping": item.get("shipping", {}).get("free_shipping", False)
+                    "free_shipping": free_shipping
                 })
             
             # Calculate statistics
             if not prices:
                 return None
-            
-            avg_price = statistics.mean(prices)
-            min_price = min(prices)
-            max_price = max(prices)
+
+            # Vectorized: one C pass instead of pure-Python mean/stdev loops
+            prices_arr = np.asarray(prices, dtype=np.float64)
+            avg_price = float(prices_arr.mean())
+            min_price = float(prices_arr.min())
+            max_price = float(prices_arr.max())
             free_shipping_pct = (free_shipping_count / len(items)) * 100
-            
+
             # Determine competition level
             # Based on number of results and price variance
-            price_variance = statistics.stdev(prices) if len(prices) > 1 else 0
+            price_variance = float(prices_arr.std(ddof=1)) if len(prices) > 1 else 0
             variance_pct = (price_variance / avg_price) * 100 if avg_price > 0 else 0
             
-            if len(items) < 10:
-                competition_level = "low"
-            elif len(items) < 50 and variance_pct > 20:
-                competition_level = "medium"
-            else:
-                competition_level = "high"
+            competition_level = classify_competition(len(items), variance_pct)
             
             # Save analysis
             analysis = CompetitorAnalysis(
@@ -84,7 +111,10 @@ class CompetitorAnalyzer:
             
             self.db.add(analysis)
             self.db.commit()
-            
+
+            # Fresh data supersedes whatever was cached
+            _latest_cache.pop(product_id, None)
+
             logger.info(f"Competition analyzed: {keyword} = {competition_level}")
             
             return {
@@ -104,20 +134,29 @@ class CompetitorAnalyzer:
     def get_latest_analysis(self, product_id: int) -> Optional[Dict]:
         """Get most recent competition analysis"""
         try:
+            entry = _latest_cache.get(product_id)
+            if entry is not None:
+                timestamp, cached = entry
+                if time.time() - timestamp <= _LATEST_TTL:
+                    return cached
+                del _latest_cache[product_id]
+
             analysis = self.db.query(CompetitorAnalysis).filter(
                 CompetitorAnalysis.product_id == product_id
             ).order_by(CompetitorAnalysis.created_at.desc()).first()
-            
+
             if analysis:
-                return {
+                result = {
                     "avg_price": analysis.avg_price,
                     "min_price": analysis.min_price,
                     "max_price": analysis.max_price,
                     "competition_level": analysis.competition_level,
                     "free_shipping_percentage": analysis.free_shipping_percentage
                 }
+                _latest_cache[product_id] = (time.time(), result)
+                return result
             return None
-            
+
         except Exception as e:
             logger.error(f"Error getting analysis: {str(e)}")
             return None
@@ -1,148 +1,209 @@
 from typing import List, Dict
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from database.models import Product, ProductMetrics, Listing
 from datetime import datetime, timedelta
 from config import business_rules
+from core.pricing_calculator import calculate_margin
 from api.mercadolibre import ml_api
 from utils.logger import logger
 from utils.notifications import notify_optimization
+import asyncio
+
+def _compile_evaluate_actions(rules=business_rules):
+    """Specialize the per-product decision function for fixed rules.
+
+    The thresholds are read from the rules module once here and bound
+    as closure constants, so the returned function is pure local loads
+    and compares — partial evaluation of the business rules.
+    """
+    pause_no_sales_days = rules.PAUSE_NO_SALES_DAYS
+    pause_min_visits = rules.PAUSE_MIN_VISITS
+    pause_min_ctr = rules.PAUSE_MIN_CTR
+    min_margin = rules.MIN_MARGIN_PERCENTAGE
+    ads_min_sales = rules.ADS_MIN_SALES
+    ads_min_margin = rules.ADS_MIN_MARGIN
+    ads_min_ctr = rules.ADS_MIN_CTR
+    ads_min_roas = rules.ADS_MIN_ROAS
+    scale_min_sales = rules.SCALE_MIN_SALES_7DAYS
+    scale_min_conversion = rules.SCALE_MIN_CONVERSION
+    scale_min_stock = rules.SCALE_MIN_STOCK
+    scale_min_margin = min_margin + 5
+
+    def evaluate_actions(product: Product, metrics: ProductMetrics,
+                         now: datetime) -> set:
+        """Decide which actions to take for a product.
+
+        Reads each metric field once into locals and evaluates all the
+        rules in a single pass.
+        """
+        visits = metrics.total_visits
+        sales = metrics.total_sales
+        ctr = metrics.ctr
+        conversion = metrics.conversion_rate
+        last_sale_date = metrics.last_sale_date
+        margin = product.margin_percentage
+
+        actions = set()
+
+        # Pause: no sales in X days + low visits, dead CTR, or margin too low
+        if last_sale_date:
+            days_since_sale = (now - last_sale_date).days
+            if days_since_sale >= pause_no_sales_days and \
+               visits < pause_min_visits:
+                actions.add("pause")
+
+        if visits > 100 and ctr < pause_min_ctr:
+            actions.add("pause")
+
+        if margin < min_margin:
+            actions.add("pause")
+
+        # Adjust price: low CTR or low conversion with enough visits
+        if (visits > 50 and ctr < 1.0) or (visits > 200 and conversion < 1.0):
+            actions.add("adjust_price")
+
+        # Activate ads: has sales, good margin, good CTR
+        if sales >= ads_min_sales and \
+           margin >= ads_min_margin and \
+           ctr >= ads_min_ctr:
+            actions.add("activate_ads")
+
+        # Pause ads: low ROAS
+        # TODO: Implement ROAS calculation from last 7 days
+        roas = 0
+        if roas > 0 and roas < ads_min_roas:
+            actions.add("pause_ads")
+
+        # Scale: strong recent performance with stock to back it
+        # TODO: Implement 7-day metrics
+        recent_sales = sales  # Placeholder
+        if recent_sales >= scale_min_sales and \
+           conversion >= scale_min_conversion and \
+           margin >= scale_min_margin and \
+           product.stock >= scale_min_stock:
+            actions.add("scale")
+
+        return actions
+
+    return evaluate_actions
 
 class PerformanceOptimizer:
     """Optimize product performance automatically"""
-    
+
     def __init__(self, db: Session):
         self.db = db
-    
+        # When True, per-product mutations stay in the session and the
+        # sweep commits once at the end
+        self._defer_commit = False
+        # ML item updates queued during a sweep, flushed in one
+        # concurrent batch after the decisions are made
+        self._pending_updates = []
+        # Decision function specialized once for the current rules
+        self._evaluate_actions = _compile_evaluate_actions()
+
+    def _commit(self):
+        if not self._defer_commit:
+            self.db.commit()
+
+    async def _push_item_update(self, item_id: str, payload: Dict):
+        """Send an ML item update, or queue it during a batch sweep"""
+        if self._defer_commit:
+            self._pending_updates.append((item_id, payload))
+        else:
+            await ml_api.update_item(item_id, payload)
+
     async def optimize_all_products(self):
-        """Run optimization for all published products"""
+        """Run optimization for all published products concurrently"""
         try:
-            products = self.db.query(Product).filter(
+            # Eager-load metrics in one IN-query so the tasks below
+            # never lazy-load them one product at a time
+            products = self.db.query(Product).options(
+                selectinload(Product.metrics)
+            ).filter(
                 Product.status == "published"
             ).all()
-            
-            for product in products:
-                await self.optimize_product(product.id)
-            
+
+            # Each product does several network round-trips; fan out
+            # instead of awaiting them one after another
+            sem = asyncio.Semaphore(business_rules.OPTIMIZE_CONCURRENCY)
+
+            # One timestamp for the whole sweep; every decision below
+            # wants the same "now"
+            now = datetime.utcnow()
+
+            async def optimize_one(product: Product):
+                async with sem:
+                    await self._optimize(product, now)
+
+            # Accumulate all updates and fsync once instead of per product
+            self._defer_commit = True
+            self._pending_updates = []
+            try:
+                await asyncio.gather(
+                    *[optimize_one(product) for product in products],
+                    return_exceptions=True
+                )
+                # Decisions done: flush queued ML updates in one
+                # concurrent batch, then commit
+                await ml_api.update_items_bulk(self._pending_updates)
+                self.db.commit()
+            finally:
+                self._defer_commit = False
+                self._pending_updates = []
+
             logger.info(f"Optimization completed for {len(products)} products")
-            
+
         except Exception as e:
             logger.error(f"Error in optimization: {str(e)}")
     
     async def optimize_product(self, product_id: int):
-        """Optimize single product"""
+        """Optimize single product by id"""
+        product = self.db.query(Product).options(
+            selectinload(Product.metrics)
+        ).filter(Product.id == product_id).first()
+
+        await self._optimize(product, datetime.utcnow())
+
+    async def _optimize(self, product: Product, now: datetime):
+        """Optimize an already-loaded product"""
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
             if not product or product.status != "published":
                 return
-            
+
             metrics = product.metrics
             if not metrics:
                 return
-            
-            # Check if should pause
-            if self._should_pause(product, metrics):
+
+            actions = self._evaluate_actions(product, metrics, now)
+
+            # Pausing supersedes everything else
+            if "pause" in actions:
                 await self._pause_product(product, "Low performance")
                 return
-            
-            # Check if should adjust price
-            if self._should_adjust_price(product, metrics):
+
+            if "adjust_price" in actions:
                 await self._adjust_price(product)
-            
-            # Check if should activate ads
-            if self._should_activate_ads(product, metrics):
+
+            if "activate_ads" in actions:
                 await self._activate_ads(product)
-            
-            # Check if should pause ads
-            if self._should_pause_ads(product, metrics):
+
+            if "pause_ads" in actions:
                 await self._pause_ads(product)
-            
-            # Check if should scale
-            if self._should_scale(product, metrics):
+
+            if "scale" in actions:
                 await self._scale_product(product)
-            
+
         except Exception as e:
-            logger.error(f"Error optimizing product {product_id}: {str(e)}")
-    
-    def _should_pause(self, product: Product, metrics: ProductMetrics) -> bool:
-        """Check if product should be paused"""
-        
-        # No sales in X days + low visits
-        if metrics.last_sale_date:
-            days_since_sale = (datetime.utcnow() - metrics.last_sale_date).days
-            if days_since_sale >= business_rules.PAUSE_NO_SALES_DAYS and \
-               metrics.total_visits < business_rules.PAUSE_MIN_VISITS:
-                return True
-        
-        # Very low CTR with decent visits
-        if metrics.total_visits > 100 and metrics.ctr < business_rules.PAUSE_MIN_CTR:
-            return True
-        
-        # Margin too low
-        if product.margin_percentage < business_rules.MIN_MARGIN_PERCENTAGE:
-            return True
-        
-        return False
-    
-    def _should_adjust_price(self, product: Product, metrics: ProductMetrics) -> bool:
-        """Check if price should be adjusted"""
-        
-        # Low CTR with visits
-        if metrics.total_visits > 50 and metrics.ctr < 1.0:
-            return True
-        
-        # Low conversion with visits
-        if metrics.total_visits > 200 and metrics.conversion_rate < 1.0:
-            return True
-        
-        return False
-    
-    def _should_activate_ads(self, product: Product, metrics: ProductMetrics) -> bool:
-        """Check if ads should be activated"""
-        
-        # Has sales, good margin, good CTR
-        if metrics.total_sales >= business_rules.ADS_MIN_SALES and \
-           product.margin_percentage >= business_rules.ADS_MIN_MARGIN and \
-           metrics.ctr >= business_rules.ADS_MIN_CTR:
-            return True
-        
-        return False
-    
-    def _should_pause_ads(self, product: Product, metrics: ProductMetrics) -> bool:
-        """Check if ads should be paused"""
-        
-        # Calculate ROAS from last 7 days
-        # TODO: Implement ROAS calculation
-        # For now, placeholder
-        roas = 0
-        
-        if roas > 0 and roas < business_rules.ADS_MIN_ROAS:
-            return True
-        
-        return False
-    
-    def _should_scale(self, product: Product, metrics: ProductMetrics) -> bool:
-        """Check if product should be scaled"""
-        
-        # Recent performance check (last 7 days)
-        # TODO: Implement 7-day metrics
-        recent_sales = metrics.total_sales  # Placeholder
-        
-        if recent_sales >= business_rules.SCALE_MIN_SALES_7DAYS and \
-           metrics.conversion_rate >= business_rules.SCALE_MIN_CONVERSION and \
-           product.margin_percentage >= (business_rules.MIN_MARGIN_PERCENTAGE + 5) and \
-           product.stock >= business_rules.SCALE_MIN_STOCK:
-            return True
-        
-        return False
+            logger.error(f"Error optimizing product {product.id}: {str(e)}")
     
     async def _pause_product(self, product: Product, reason: str):
         """Pause product listing"""
         try:
             if product.ml_item_id:
-                await ml_api.update_item(product.ml_item_id, {"status": "paused"})
+                await self._push_item_update(product.ml_item_id, {"status": "paused"})
             
             product.status = "paused"
-            self.db.commit()
+            self._commit()
             
             notify_optimization("Product Paused", product.name, reason)
             logger.info(f"Product paused: {product.sku} - {reason}")
@@ -158,7 +219,6 @@ class PerformanceOptimizer:
             new_price = product.final_price * (1 - reduction_pct / 100)
             
             # Check minimum margin
-            from core.pricing_calculator import calculate_margin
             new_margin = calculate_margin(
                 new_price,
                 product.base_cost,
@@ -172,12 +232,12 @@ class PerformanceOptimizer:
             
             # Update price
             if product.ml_item_id:
-                await ml_api.update_item(product.ml_item_id, {"price": new_price})
+                await self._push_item_update(product.ml_item_id, {"price": new_price})
             
             old_price = product.final_price
             product.final_price = new_price
             product.margin_percentage = new_margin
-            self.db.commit()
+            self._commit()
             
             notify_optimization(
                 "Price Adjusted",
@@ -1,68 +1,107 @@
 from typing import Dict, Optional
 from config import business_rules
+from functools import lru_cache
 from utils.logger import logger
+import numpy as np
 
-def calculate_optimal_price(base_cost: float, category_id: str = None, 
+# Bind the business-rule constants once at import time; the hot pricing
+# math then uses plain local/global loads instead of attribute lookups
+_IVA = business_rules.IVA_PERCENTAGE
+_ISR = business_rules.ISR_PERCENTAGE
+_MIN_MARGIN = business_rules.MIN_MARGIN_PERCENTAGE
+_IDEAL_MARGIN = business_rules.IDEAL_MARGIN_PERCENTAGE
+
+# Default commission (if can't get from API)
+_DEFAULT_COMMISSION = 13.0  # Average for most categories
+
+# Derived factors: since the taxes, default commission and margin
+# targets are fixed per process, every price is just base_cost times a
+# constant — no divisions inside the call
+_IVA_FACTOR = 1 + _IVA / 100
+_TOTAL_COST_PCT = _DEFAULT_COMMISSION + _ISR
+_BREAKEVEN_DIV = 1 / (1 - _TOTAL_COST_PCT / 100)
+_MIN_MARGIN_DIV = 1 / (1 - (_TOTAL_COST_PCT + _MIN_MARGIN) / 100)
+_IDEAL_MARGIN_DIV = 1 / (1 - (_TOTAL_COST_PCT + _IDEAL_MARGIN) / 100)
+
+def calculate_optimal_price(base_cost: float, category_id: str = None,
                            product_name: str = None) -> Optional[Dict]:
     """
     Calculate optimal pricing with all costs included
-    
+
     Returns:
-        Dict with: optimal_price, competitive_price, margin_percentage, 
+        Dict with: optimal_price, competitive_price, margin_percentage,
                   commission_percentage, shipping_cost, etc.
     """
+    raw = calculate_optimal_price_raw(base_cost, category_id, product_name)
+    if raw is None:
+        return None
+    # Round only at this boundary; callers that keep computing should
+    # use the raw variant directly
+    return {
+        key: round(value, 2) if isinstance(value, float) else value
+        for key, value in raw.items()
+    }
+
+@lru_cache(maxsize=8192)
+def _price_core(base_cost_cents: int, category_id: Optional[str]) -> tuple:
+    """Pure pricing math, memoized on (cost in cents, category).
+
+    Imports commonly repeat the same (base_cost, category) pairs across
+    thousands of products; identical inputs hit the cache instead of
+    redoing the arithmetic. Returns an immutable tuple so cached values
+    can't be mutated by callers.
+    """
+    base_cost = base_cost_cents / 100
+
+    # Shipping (free shipping for competitive products)
+    shipping_cost = 0.0  # Will be calculated based on competition
+
+    # All three price points are base_cost times a precomputed
+    # constant (breakeven / min-margin / ideal-margin, IVA applied)
+    min_price_with_iva = base_cost * _BREAKEVEN_DIV * _IVA_FACTOR
+    min_margin_price_with_iva = base_cost * _MIN_MARGIN_DIV * _IVA_FACTOR
+    ideal_margin_price_with_iva = base_cost * _IDEAL_MARGIN_DIV * _IVA_FACTOR
+
+    # Competitive price (between min margin and ideal margin)
+    competitive_price = (min_margin_price_with_iva + ideal_margin_price_with_iva) / 2
+
+    # Actual margin at competitive price, derived analytically
+    revenue_without_iva = competitive_price / _IVA_FACTOR
+    costs = (_TOTAL_COST_PCT / 100) * revenue_without_iva + shipping_cost
+    profit = revenue_without_iva - base_cost - costs
+    margin_percentage = (profit / revenue_without_iva) * 100
+
+    return (
+        shipping_cost, min_price_with_iva, min_margin_price_with_iva,
+        ideal_margin_price_with_iva, competitive_price, costs,
+        margin_percentage, profit
+    )
+
+def calculate_optimal_price_raw(base_cost: float, category_id: str = None,
+                                product_name: str = None) -> Optional[Dict]:
+    """calculate_optimal_price without the rounding pass (raw floats)"""
     try:
-        # Default commission (if can't get from API)
-        commission_percentage = 13.0  # Average for most categories
-        
-        # Shipping (free shipping for competitive products)
-        shipping_cost = 0.0  # Will be calculated based on competition
-        
-        # Taxes
-        iva_percentage = business_rules.IVA_PERCENTAGE
-        isr_percentage = business_rules.ISR_PERCENTAGE
-        
-        # Total cost percentage
-        total_cost_percentage = commission_percentage + isr_percentage
-        
-        # Calculate minimum viable price (breakeven)
-        min_price = base_cost / (1 - (total_cost_percentage / 100))
-        
-        # Calculate price with minimum margin (30%)
-        min_margin_price = base_cost / (1 - ((total_cost_percentage + business_rules.MIN_MARGIN_PERCENTAGE) / 100))
-        
-        # Calculate price with ideal margin (40%)
-        ideal_margin_price = base_cost / (1 - ((total_cost_percentage + business_rules.IDEAL_MARGIN_PERCENTAGE) / 100))
-        
-        # Apply IVA
-        min_price_with_iva = min_price * (1 + iva_percentage / 100)
-        min_margin_price_with_iva = min_margin_price * (1 + iva_percentage / 100)
-        ideal_margin_price_with_iva = ideal_margin_price * (1 + iva_percentage / 100)
-        
-        # Competitive price (between min margin and ideal margin)
-        competitive_price = (min_margin_price_with_iva + ideal_margin_price_with_iva) / 2
-        
-        # Calculate actual margin at competitive price
-        revenue_without_iva = competitive_price / (1 + iva_percentage / 100)
-        costs = (commission_percentage + isr_percentage) / 100 * revenue_without_iva + shipping_cost
-        profit = revenue_without_iva - base_cost - costs
-        margin_percentage = (profit / revenue_without_iva) * 100
-        
+        (shipping_cost, min_price_with_iva, min_margin_price_with_iva,
+         ideal_margin_price_with_iva, competitive_price, costs,
+         margin_percentage, profit) = _price_core(
+            round(base_cost * 100), category_id
+        )
+
         return {
-            "base_cost": round(base_cost, 2),
-            "commission_percentage": commission_percentage,
-            "commission_amount": round(costs, 2),
+            "base_cost": base_cost,
+            "commission_percentage": _DEFAULT_COMMISSION,
+            "commission_amount": costs,
             "shipping_cost": shipping_cost,
-            "iva_percentage": iva_percentage,
-            "isr_percentage": isr_percentage,
-            "min_price": round(min_price_with_iva, 2),
-            "min_margin_price": round(min_margin_price_with_iva, 2),
-            "optimal_price": round(ideal_margin_price_with_iva, 2),
-            "competitive_price": round(competitive_price, 2),
-            "margin_percentage": round(margin_percentage, 2),
-            "profit": round(profit, 2)
+            "iva_percentage": _IVA,
+            "isr_percentage": _ISR,
+            "min_price": min_price_with_iva,
+            "min_margin_price": min_margin_price_with_iva,
+            "optimal_price": ideal_margin_price_with_iva,
+            "competitive_price": competitive_price,
+            "margin_percentage": margin_percentage,
+            "profit": profit
         }
-        
+
     except Exception as e:
         logger.error(f"Error calculating price: {str(e)}")
         return None
@@ -70,8 +109,8 @@ def calculate_optimal_price(base_cost: float, category_id: str = None,
 def calculate_breakeven_price(base_cost: float, commission_percentage: float,
                               shipping_cost: float = 0) -> float:
     """Calculate breakeven price"""
-    iva = business_rules.IVA_PERCENTAGE
-    isr = business_rules.ISR_PERCENTAGE
+    iva = _IVA
+    isr = _ISR
     
     total_cost_pct = commission_percentage + isr
     price_without_iva = (base_cost + shipping_cost) / (1 - (total_cost_pct / 100))
@@ -83,8 +122,8 @@ def calculate_margin(price: float, base_cost: float,
                     commission_percentage: float, shipping_cost: float = 0) -> float:
     """Calculate profit margin percentage"""
     try:
-        iva = business_rules.IVA_PERCENTAGE
-        isr = business_rules.ISR_PERCENTAGE
+        iva = _IVA
+        isr = _ISR
         
         # Remove IVA
         price_without_iva = price / (1 + iva / 100)
@@ -97,9 +136,33 @@ def calculate_margin(price: float, base_cost: float,
         # Calculate profit
         profit = price_without_iva - total_costs
         margin = (profit / price_without_iva) * 100
-        
+
         return round(margin, 2)
-        
+
     except Exception as e:
         logger.error(f"Error calculating margin: {str(e)}")
         return 0.0
+
+def calculate_margin_batch(prices: np.ndarray, base_costs: np.ndarray,
+                           commission_percentages: np.ndarray,
+                           shipping_costs: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_margin over aligned arrays of products.
+
+    Runs the same arithmetic as calculate_margin as NumPy vector ops,
+    so repricing sweeps pay the Python overhead once per batch instead
+    of once per product.
+    """
+    prices_without_iva = np.asarray(prices, dtype=np.float64) / _IVA_FACTOR
+
+    commissions = (np.asarray(commission_percentages, dtype=np.float64) / 100) * prices_without_iva
+    isr_amounts = (_ISR / 100) * prices_without_iva
+    total_costs = (
+        np.asarray(base_costs, dtype=np.float64)
+        + commissions + isr_amounts
+        + np.asarray(shipping_costs, dtype=np.float64)
+    )
+
+    profits = prices_without_iva - total_costs
+    margins = (profits / prices_without_iva) * 100
+
+    return np.round(margins, 2)
@@ -3,10 +3,67 @@ from sqlalchemy.orm import Session
 from database.models import Product, ProductMetrics, ActionLog
 from api.mercadolibre import ml_api
 from api.shopify import shopify_api
-from core.pricing_calculator import calculate_optimal_price
-from core.scoring_engine import calculate_product_score
+from config.settings import get_settings
+from core.action_log import action_log_batcher
+from core.pricing_calculator import calculate_optimal_price, calculate_optimal_price_raw
+from core.scoring_engine import calculate_product_score, calculate_product_scores_bulk
 from utils.logger import logger
 from datetime import datetime
+from collections import Counter
+import asyncio
+import numpy as np
+import re
+
+settings = get_settings()
+
+# Stopwords and token pattern for title keyword extraction
+_STOPWORDS = frozenset({
+    'para', 'con', 'sin', 'por', 'los', 'las', 'del', 'una', 'uno'
+})
+_WORD_RE = re.compile(r"\w{4,}", re.UNICODE)
+
+# ML publishing defaults
+_ML_DEFAULT_CATEGORY = "MLM1055"
+_DEFAULT_LISTING_TYPE = "gold_special"
+
+# Static part of the ML item payload; per-product fields are merged in
+_ITEM_TEMPLATE = {
+    "currency_id": "MXN",
+    "buying_mode": "buy_it_now",
+    "listing_type_id": _DEFAULT_LISTING_TYPE,
+    "condition": "new"
+}
+
+# Publish payloads keyed by product id, revalidated against the fields
+# that feed them; republish attempts skip rebuilding the dict and the
+# pictures list when nothing changed
+_payload_cache: Dict[int, tuple] = {}
+
+def _build_item_payload(product: Product) -> Dict:
+    """Build the ML item payload for a product (cached per version)"""
+    version = (product.updated_at, product.final_price, product.stock)
+    cached = _payload_cache.get(product.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    payload = {
+        **_ITEM_TEMPLATE,
+        "title": product.name[:60],
+        "category_id": product.ml_category_id or _ML_DEFAULT_CATEGORY,
+        "price": product.final_price,
+        "available_quantity": product.stock,
+        "description": {
+            "plain_text": f"Producto: {product.name}\n\nSKU: {product.sku}"
+        },
+        "pictures": [{"source": img} for img in (product.images or [])[:10]],
+        "shipping": {
+            "mode": "me2",
+            "free_shipping": product.shipping_cost == 0
+        }
+    }
+
+    _payload_cache[product.id] = (version, payload)
+    return payload
 
 class ProductManager:
     """Manage product lifecycle"""
@@ -44,73 +101,233 @@ class ProductManager:
             )
             
             self.db.add(product)
-            self.db.commit()
-            self.db.refresh(product)
-            
+            # Flush assigns product.id without the cost of a commit
+            self.db.flush()
+
             # Create metrics
             metrics = ProductMetrics(product_id=product.id)
             self.db.add(metrics)
             self.db.commit()
-            
+
             logger.info(f"Product created: {product.sku}")
             return product
-            
+
         except Exception as e:
             logger.error(f"Error creating product: {str(e)}")
             self.db.rollback()
             return None
+
+    def bulk_create_product_ids(self, rows: List[Dict]) -> List[int]:
+        """Insert many products via executemany, returning the new ids.
+
+        Skips ORM instance construction and unit-of-work bookkeeping:
+        the products and their metrics rows go in as two
+        bulk_insert_mappings executemany batches, with the ids read
+        back in one indexed SKU lookup.
+        """
+        try:
+            skus = [row["sku"] for row in rows]
+            existing = {
+                sku for (sku,) in
+                self.db.query(Product.sku).filter(Product.sku.in_(skus))
+            }
+
+            mappings = []
+            for row in rows:
+                if row["sku"] in existing:
+                    logger.warning(f"Product already exists: {row['sku']}")
+                    continue
+                # Also dedup within the batch itself
+                existing.add(row["sku"])
+
+                mappings.append({
+                    "sku": row["sku"],
+                    "name": row["name"],
+                    "base_cost": row["base_cost"],
+                    "shipping_cost": row.get("shipping_cost", 0),
+                    "stock": row.get("stock", 0),
+                    "category": row.get("category"),
+                    "images": row.get("images", []),
+                    "status": "pending"
+                })
+
+            if not mappings:
+                return []
+
+            self.db.bulk_insert_mappings(Product, mappings)
+
+            new_ids = [
+                pid for (pid,) in
+                self.db.query(Product.id).filter(
+                    Product.sku.in_([m["sku"] for m in mappings])
+                )
+            ]
+            self.db.bulk_insert_mappings(
+                ProductMetrics, [{"product_id": pid} for pid in new_ids]
+            )
+            self.db.commit()
+
+            logger.info(f"Created {len(new_ids)} products")
+            return new_ids
+
+        except Exception as e:
+            logger.error(f"Error bulk creating products: {str(e)}")
+            self.db.rollback()
+            return []
     
+    def _build_score_update(self, product: Product) -> Optional[Dict]:
+        """Compute the pricing/score column values for a product.
+
+        Pure computation: returns an update mapping (keyed by id) that
+        callers apply to the instance or pass to bulk_update_mappings.
+        """
+        # Calculate pricing
+        pricing = calculate_optimal_price(
+            base_cost=product.base_cost,
+            category_id=product.ml_category_id,
+            product_name=product.name
+        )
+
+        if not pricing:
+            logger.error(f"Failed to calculate pricing for {product.sku}")
+            return None
+
+        # Calculate score
+        score_data = calculate_product_score(product, pricing)
+        score = score_data["total_score"]
+
+        # Determine status
+        if score >= 80:
+            status = "approved"
+            auto_approved = True
+        elif score >= 50:
+            status = "needs_approval"
+            auto_approved = False
+        else:
+            status = "rejected"
+            auto_approved = False
+
+        update = {
+            "id": product.id,
+            "calculated_price": pricing["optimal_price"],
+            "final_price": pricing["competitive_price"],
+            "margin_percentage": pricing["margin_percentage"],
+            "ml_commission_percentage": pricing["commission_percentage"],
+            "score": score,
+            "status": status,
+            "auto_approved": auto_approved,
+            "updated_at": datetime.utcnow()
+        }
+
+        # Keep user-provided shipping cost if set
+        if not product.shipping_cost:
+            update["shipping_cost"] = pricing["shipping_cost"]
+
+        logger.info(f"Product scored: {product.sku} = {score}")
+        return update
+
+    def _score_product(self, product: Product) -> bool:
+        """Calculate pricing and score for an already-loaded product.
+
+        Mutates the product in place without committing so callers can
+        batch many products into a single transaction.
+        """
+        update = self._build_score_update(product)
+        if update is None:
+            return False
+
+        for field, value in update.items():
+            if field != "id":
+                setattr(product, field, value)
+        return True
+
     def calculate_and_score(self, product_id: int) -> bool:
         """Calculate pricing and score for product"""
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
+            product = self.db.get(Product, product_id)
             if not product:
                 return False
-            
-            # Calculate pricing
-            pricing = calculate_optimal_price(
-                base_cost=product.base_cost,
-                category_id=product.ml_category_id,
-                product_name=product.name
-            )
-            
-            if not pricing:
-                logger.error(f"Failed to calculate pricing for {product.sku}")
+
+            if not self._score_product(product):
                 return False
-            
-            # Update product
-            product.calculated_price = pricing["optimal_price"]
-            product.final_price = pricing["competitive_price"]
-            product.margin_percentage = pricing["margin_percentage"]
-            product.ml_commission_percentage = pricing["commission_percentage"]
-            
-            # Keep user-provided shipping cost if set
-            if not product.shipping_cost:
-                product.shipping_cost = pricing["shipping_cost"]
-            
-            # Calculate score
-            score_data = calculate_product_score(product, pricing)
-            product.score = score_data["total_score"]
-            
-            # Determine status
-            if product.score >= 80:
-                product.status = "approved"
-                product.auto_approved = True
-            elif product.score >= 50:
-                product.status = "needs_approval"
-            else:
-                product.status = "rejected"
-            
-            product.updated_at = datetime.utcnow()
+
             self.db.commit()
-            
-            logger.info(f"Product scored: {product.sku} = {product.score}")
             return True
-            
+
         except Exception as e:
             logger.error(f"Error calculating and scoring: {str(e)}")
             self.db.rollback()
             return False
+
+    def bulk_calculate_and_score(self, product_ids: List[int]) -> int:
+        """Score many products with one SELECT and one COMMIT.
+
+        Pricing goes through the memoized price core once per product
+        (identical cost/category pairs hit the cache); scores and status
+        buckets are computed as one NumPy pass over the whole batch,
+        then everything is written with a single bulk_update_mappings.
+        Returns the number of products successfully scored.
+        """
+        try:
+            products = self.db.query(Product).filter(
+                Product.id.in_(product_ids)
+            ).all()
+
+            priced = []
+            for product in products:
+                pricing = calculate_optimal_price_raw(
+                    base_cost=product.base_cost,
+                    category_id=product.ml_category_id,
+                    product_name=product.name
+                )
+                if pricing is None:
+                    logger.error(f"Failed to calculate pricing for {product.sku}")
+                    continue
+                priced.append((product, pricing))
+
+            if not priced:
+                self.db.commit()
+                return 0
+
+            margins = np.array([pr["margin_percentage"] for _, pr in priced])
+            competitive = np.array([pr["competitive_price"] for _, pr in priced])
+            optimal = np.array([pr["optimal_price"] for _, pr in priced])
+
+            scores = calculate_product_scores_bulk(margins, competitive, optimal)
+            statuses = np.select(
+                [scores >= 80, scores >= 50],
+                ["approved", "needs_approval"],
+                "rejected"
+            )
+            auto_approved = scores >= 80
+
+            now = datetime.utcnow()
+            updates = []
+            for i, (product, pricing) in enumerate(priced):
+                update = {
+                    "id": product.id,
+                    "calculated_price": round(pricing["optimal_price"], 2),
+                    "final_price": round(pricing["competitive_price"], 2),
+                    "margin_percentage": round(pricing["margin_percentage"], 2),
+                    "ml_commission_percentage": pricing["commission_percentage"],
+                    "score": int(scores[i]),
+                    "status": str(statuses[i]),
+                    "auto_approved": bool(auto_approved[i]),
+                    "updated_at": now
+                }
+                if not product.shipping_cost:
+                    update["shipping_cost"] = round(pricing["shipping_cost"], 2)
+                updates.append(update)
+
+            self.db.bulk_update_mappings(Product, updates)
+            self.db.commit()
+            logger.info(f"Scored {len(updates)} products in bulk")
+            return len(updates)
+
+        except Exception as e:
+            logger.error(f"Error bulk scoring: {str(e)}")
+            self.db.rollback()
+            return 0
     
     async def optimize_title(self, basic_title: str) -> Optional[str]:
         """
@@ -125,32 +342,40 @@ class ProductManager:
                 logger.warning(f"No search results for title optimization: {basic_title}")
                 return None
             
-            # Extract common keywords from top results
-            keywords = set()
-            for item in search_results['results'][:5]:
-                title = item.get('title', '')
-                # Extract words (longer than 3 chars, excluding common words)
-                words = [
-                    w for w in title.split() 
-                    if len(w) > 3 and w.lower() not in [
-                        'para', 'con', 'sin', 'por', 'los', 'las', 'del', 'una', 'uno'
-                    ]
-                ]
-                keywords.update(words[:10])
-            
+            # Extract the most frequent keywords from top results
+            # (single pass, O(1) stopword lookups via the module-level set)
+            tokens = (
+                match.group(0)
+                for item in search_results[:5]
+                for match in _WORD_RE.finditer(item.get('title', '').lower())
+                if match.group(0) not in _STOPWORDS
+            )
+            popular_keywords = [word for word, _ in Counter(tokens).most_common(5)]
+
             # Build optimized title
-            # Start with basic title capitalized
-            optimized = basic_title.strip().title()
-            
-            # Add relevant keywords (max 60 chars for ML)
-            popular_keywords = list(keywords)[:5]
+            # Start with basic title capitalized (word-wise capitalize is
+            # cheaper than str.title's per-character Unicode casing)
+            base = " ".join(
+                word.capitalize() for word in basic_title.strip().split()
+            )
+
+            # Add relevant keywords (max 60 chars for ML), tracking the
+            # seen tokens and running length incrementally instead of
+            # re-lowercasing the growing title per candidate
+            tokens_lower = set(base.lower().split())
+            parts = [base]
+            total_len = len(base)
+
             for keyword in popular_keywords:
-                if keyword.lower() not in optimized.lower():
-                    test_title = f"{optimized} {keyword.title()}"
-                    if len(test_title) <= 60:
-                        optimized = test_title
-                    else:
-                        break
+                if keyword in tokens_lower:
+                    continue
+                if total_len + 1 + len(keyword) > 60:
+                    break
+                parts.append(keyword.capitalize())
+                tokens_lower.add(keyword)
+                total_len += 1 + len(keyword)
+
+            optimized = " ".join(parts)
             
             logger.info(f"Title optimized: '{basic_title}' -> '{optimized}'")
             return optimized
@@ -161,80 +386,80 @@ class ProductManager:
     
     async def publish_to_ml(self, product_id: int) -> Optional[str]:
         """Publish product to Mercado Libre"""
+        product = self.db.get(Product, product_id)
+        if not product:
+            return None
+
+        return await self._publish_product(product)
+
+    async def _create_ml_item(self, product: Product) -> Optional[Dict]:
+        """Create the ML item for a product (network only, no DB writes)"""
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
-            if not product:
-                return None
-            
-            # Build item data
-            item_data = {
-                "title": product.name[:60],
-                "category_id": product.ml_category_id or "MLM1055",
-                "price": product.final_price,
-                "currency_id": "MXN",
-                "available_quantity": product.stock,
-                "buying_mode": "buy_it_now",
-                "listing_type_id": "gold_special",
-                "condition": "new",
-                "description": {
-                    "plain_text": f"Producto: {product.name}\n\nSKU: {product.sku}"
-                },
-                "pictures": [{"source": img} for img in (product.images or [])[:10]],
-                "shipping": {
-                    "mode": "me2",
-                    "free_shipping": product.shipping_cost == 0
-                }
-            }
-            
-            # Create item
-            result = await ml_api.create_item(item_data)
-            
+            result = await ml_api.create_item(_build_item_payload(product))
+
             if result:
-                product.ml_item_id = result["id"]
-                product.ml_permalink = result["permalink"]
-                product.status = "published"
-                product.published_at = datetime.utcnow()
-                self.db.commit()
-                
-                # Log action
-                self.log_action(
-                    product_id=product.id,
-                    action_type="published",
-                    reason=f"Auto-published with score {product.score}",
-                    new_value=result["id"],
-                    success=True
-                )
-                
                 logger.info(f"Product published: {product.sku} -> {result['id']}")
-                return result["id"]
-            else:
-                self.log_action(
-                    product_id=product.id,
-                    action_type="publish_failed",
-                    reason="ML API error",
-                    success=False
-                )
-                return None
-                
+                return result
+
+            self.log_action(
+                product_id=product.id,
+                action_type="publish_failed",
+                reason="ML API error",
+                success=False
+            )
+            return None
+
         except Exception as e:
             logger.error(f"Error publishing to ML: {str(e)}")
             self.log_action(
-                product_id=product_id,
+                product_id=product.id,
                 action_type="publish_failed",
                 reason=str(e),
                 success=False
             )
             return None
-    
+
+    async def _publish_product(self, product: Product) -> Optional[str]:
+        """Publish an already-loaded product to Mercado Libre"""
+        result = await self._create_ml_item(product)
+        if not result:
+            return None
+
+        product.ml_item_id = result["id"]
+        product.ml_permalink = result["permalink"]
+        product.status = "published"
+        product.published_at = datetime.utcnow()
+        self.db.commit()
+
+        # Log action
+        self.log_action(
+            product_id=product.id,
+            action_type="published",
+            reason=f"Auto-published with score {product.score}",
+            new_value=result["id"],
+            success=True
+        )
+
+        return result["id"]
+
     async def sync_stock_with_shopify(self, product_id: int) -> bool:
         """Sync stock between ML and Shopify"""
+        product = self.db.get(Product, product_id)
+        if not product:
+            return False
+
+        return await self._sync_stock_product(product)
+
+    async def _sync_stock_product(self, product: Product) -> bool:
+        """Sync stock for an already-loaded product"""
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
-            if not product or not product.shopify_product_id:
+            if not product.shopify_product_id:
                 return False
-            
+
             # Get Shopify inventory
-            shopify_product = await shopify_api.get_product(product.shopify_product_id)
+            shopify_product = await shopify_api.get_product(
+                product.shopify_product_id, fields="id,variants"
+            )
             if not shopify_product:
                 return False
             
@@ -260,22 +485,130 @@ class ProductManager:
             logger.error(f"Error syncing stock: {str(e)}")
             return False
     
-    def log_action(self, product_id: int, action_type: str, 
+    async def bulk_publish_to_ml(self, product_ids: List[int]) -> List[Optional[str]]:
+        """Publish many products concurrently (bounded by ML_CONCURRENCY).
+
+        Runs the ML creates in a concurrent batch first, then persists
+        every successful publish with one bulk_update_mappings commit
+        instead of committing per product.
+        """
+        products = self.db.query(Product).filter(
+            Product.id.in_(product_ids)
+        ).all()
+
+        sem = asyncio.Semaphore(settings.ML_CONCURRENCY)
+
+        async def publish_one(product: Product) -> Optional[Dict]:
+            async with sem:
+                return await self._create_ml_item(product)
+
+        # return_exceptions keeps one failed publish from cancelling the
+        # batch and discarding the successes gathered so far
+        results = await asyncio.gather(
+            *[publish_one(p) for p in products], return_exceptions=True
+        )
+
+        now = datetime.utcnow()
+        updates = []
+        item_ids: List[Optional[str]] = []
+
+        for product, result in zip(products, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error publishing {product.sku}: {str(result)}")
+                result = None
+            if not result:
+                item_ids.append(None)
+                continue
+
+            updates.append({
+                "id": product.id,
+                "ml_item_id": result["id"],
+                "ml_permalink": result["permalink"],
+                "status": "published",
+                "published_at": now
+            })
+            item_ids.append(result["id"])
+
+            self.log_action(
+                product_id=product.id,
+                action_type="published",
+                reason=f"Auto-published with score {product.score}",
+                new_value=result["id"],
+                success=True
+            )
+
+        if updates:
+            self.db.bulk_update_mappings(Product, updates)
+            self.db.commit()
+
+        return item_ids
+
+    async def bulk_sync_stock(self, product_ids: List[int]) -> int:
+        """Sync stock for many products via bulk reads and one commit.
+
+        Fetches Shopify stock 250 products per request, applies the
+        diffs with a single bulk_update_mappings commit, then fans the
+        ML quantity updates out concurrently. Returns the number of
+        products whose stock changed.
+        """
+        try:
+            products = self.db.query(Product).filter(
+                Product.id.in_(product_ids),
+                Product.shopify_product_id.isnot(None)
+            ).all()
+
+            stock_by_id = await shopify_api.get_inventory_bulk(
+                [product.shopify_product_id for product in products]
+            )
+
+            changes = []
+            ml_updates = []
+            for product in products:
+                shopify_stock = stock_by_id.get(str(product.shopify_product_id))
+                if shopify_stock is None or product.stock == shopify_stock:
+                    continue
+
+                changes.append({"id": product.id, "stock": shopify_stock})
+                if product.ml_item_id:
+                    ml_updates.append(
+                        (product.ml_item_id, {"available_quantity": shopify_stock})
+                    )
+                logger.info(f"Stock synced: {product.sku} = {shopify_stock}")
+
+            if changes:
+                self.db.bulk_update_mappings(Product, changes)
+                self.db.commit()
+
+            await ml_api.update_items_bulk(ml_updates)
+            return len(changes)
+
+        except Exception as e:
+            logger.error(f"Error bulk syncing stock: {str(e)}")
+            self.db.rollback()
+            return 0
+
+    def log_action(self, product_id: int, action_type: str,
                    reason: str = None, old_value: str = None, 
                    new_value: str = None, success: bool = True,
                    error_message: str = None):
         """Log action"""
         try:
-            action = ActionLog(
-                product_id=product_id,
-                action_type=action_type,
-                reason=reason,
-                old_value=old_value,
-                new_value=new_value,
-                success=success,
-                error_message=error_message
-            )
-            self.db.add(action)
+            row = {
+                "product_id": product_id,
+                "action_type": action_type,
+                "reason": reason,
+                "old_value": old_value,
+                "new_value": new_value,
+                "success": success,
+                "error_message": error_message
+            }
+
+            # Hand off to the background batcher when it's running so
+            # hot paths don't pay one commit per log row
+            if action_log_batcher.running and action_log_batcher.enqueue(row):
+                return
+
+            self.db.add(ActionLog(**row))
             self.db.commit()
         except Exception as e:
             logger.error(f"Error logging action: {str(e)}")
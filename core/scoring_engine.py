@@ -1,7 +1,23 @@
 from typing import Dict
+from bisect import bisect_left
 from database.models import Product
 from config import business_rules
 from utils.logger import logger
+import numpy as np
+
+# Margin thresholds bound once at import
+_MIN_MARGIN = business_rules.MIN_MARGIN_PERCENTAGE
+_IDEAL_MARGIN = business_rules.IDEAL_MARGIN_PERCENTAGE
+_MARGIN_RANGE = _IDEAL_MARGIN - _MIN_MARGIN
+
+# Price-diff tiers as a bisect table: diff <=5% -> 20, <=10% -> 15,
+# <=15% -> 10, else 5
+_PRICE_DIFF_THRESHOLDS = (5, 10, 15)
+_PRICE_DIFF_POINTS = (20, 15, 10, 5)
+
+# Publish/approval cutoffs bound once at import
+_SCORE_AUTO_PUBLISH = business_rules.SCORE_AUTO_PUBLISH
+_SCORE_NEEDS_APPROVAL = business_rules.SCORE_NEEDS_APPROVAL
 
 def calculate_product_score(product: Product, pricing_data: Dict) -> Dict:
     """
@@ -21,12 +37,11 @@ def calculate_product_score(product: Product, pricing_data: Dict) -> Dict:
         
         # 1. MARGIN SCORE (40 points)
         margin = pricing_data.get("margin_percentage", 0)
-        if margin >= business_rules.IDEAL_MARGIN_PERCENTAGE:
+        if margin >= _IDEAL_MARGIN:
             scores["margin"] = 40
-        elif margin >= business_rules.MIN_MARGIN_PERCENTAGE:
+        elif margin >= _MIN_MARGIN:
             # Linear between 30% and 40%
-            range_pct = (margin - business_rules.MIN_MARGIN_PERCENTAGE) / \
-                       (business_rules.IDEAL_MARGIN_PERCENTAGE - business_rules.MIN_MARGIN_PERCENTAGE)
+            range_pct = (margin - _MIN_MARGIN) / _MARGIN_RANGE
             scores["margin"] = int(20 + (20 * range_pct))
         else:
             scores["margin"] = 0
@@ -48,14 +63,9 @@ def calculate_product_score(product: Product, pricing_data: Dict) -> Dict:
         
         if competitive_price > 0:
             price_diff_pct = abs(competitive_price - optimal_price) / optimal_price * 100
-            if price_diff_pct <= 5:
-                scores["price"] = 20
-            elif price_diff_pct <= 10:
-                scores["price"] = 15
-            elif price_diff_pct <= 15:
-                scores["price"] = 10
-            else:
-                scores["price"] = 5
+            scores["price"] = _PRICE_DIFF_POINTS[
+                bisect_left(_PRICE_DIFF_THRESHOLDS, price_diff_pct)
+            ]
         else:
             scores["price"] = 10  # Default
         
@@ -82,14 +92,48 @@ def calculate_product_score(product: Product, pricing_data: Dict) -> Dict:
             "competition": "unknown"
         }
 
+def calculate_product_scores_bulk(margins, competitive_prices,
+                                  optimal_prices) -> np.ndarray:
+    """Vectorized total scores for aligned arrays of pricing data.
+
+    Runs the calculate_product_score tiers as NumPy array ops so bulk
+    imports score thousands of products in one pass instead of one
+    Python call each. Competition and trend use the same placeholder
+    values as the scalar path.
+    """
+    margin = np.asarray(margins, dtype=np.float64)
+    competitive = np.asarray(competitive_prices, dtype=np.float64)
+    optimal = np.asarray(optimal_prices, dtype=np.float64)
+
+    # Margin tiers: 40 above ideal, linear 20-40 between min and ideal
+    linear = (20 + 20 * (margin - _MIN_MARGIN) / _MARGIN_RANGE).astype(np.int64)
+    margin_scores = np.where(
+        margin >= _IDEAL_MARGIN, 40,
+        np.where(margin >= _MIN_MARGIN, linear, 0)
+    )
+
+    # Price-diff tiers, with the scalar path's default of 10 when
+    # there is no competitive price
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_diff_pct = np.abs(competitive - optimal) / optimal * 100
+    price_scores = np.select(
+        [competitive <= 0, price_diff_pct <= 5,
+         price_diff_pct <= 10, price_diff_pct <= 15],
+        [10, 20, 15, 10],
+        default=5
+    )
+
+    # Competition (medium placeholder) + trend default
+    return margin_scores + price_scores + 15 + 10
+
 def should_auto_publish(score: int) -> bool:
     """Check if product should be auto-published"""
-    return score >= business_rules.SCORE_AUTO_PUBLISH
+    return score >= _SCORE_AUTO_PUBLISH
 
 def needs_approval(score: int) -> bool:
     """Check if product needs manual approval"""
-    return business_rules.SCORE_NEEDS_APPROVAL <= score < business_rules.SCORE_AUTO_PUBLISH
+    return _SCORE_NEEDS_APPROVAL <= score < _SCORE_AUTO_PUBLISH
 
 def should_reject(score: int) -> bool:
     """Check if product should be rejected"""
-    return score < business_rules.SCORE_NEEDS_APPROVAL
+    return score < _SCORE_NEEDS_APPROVAL
@@ -1,10 +1,17 @@
 from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from database.models import Product
 from api.mercadolibre import ml_api
 from api.shopify import shopify_api
+from config.settings import get_settings
 from core.product_manager import ProductManager
 from utils.logger import logger
+import asyncio
+
+settings = get_settings()
+
+# Seller items listing page size (ML caps at 50 without scroll tokens)
+_IMPORT_PAGE = 50
 
 class SyncManager:
     """Manage synchronization between ML, Shopify and local DB"""
@@ -16,31 +23,109 @@ class SyncManager:
         """
         Import all products from Mercado Libre
         Returns: {imported: int, updated: int, errors: []}
+
+        Listing pages and item details are network-bound, so both are
+        fetched concurrently under the shared ML semaphore; wall time is
+        ~pages/concurrency round trips instead of one per item.
         """
         try:
             logger.info("Starting ML import...")
-            
-            # Get all items from ML (TODO: implement pagination)
-            # For now, this is a placeholder - ML API requires specific endpoint
-            
+
             imported = 0
             updated = 0
             errors = []
-            
-            # TODO: Implement actual ML product listing
-            # This would require using ML's search or seller items endpoint
-            
+
+            # First page serially to learn the total, then the rest of
+            # the id pages in parallel
+            first = await ml_api.get_seller_items(offset=0, limit=_IMPORT_PAGE)
+            if first is None:
+                return {
+                    "imported": 0,
+                    "updated": 0,
+                    "errors": ["Could not list seller items"],
+                    "message": "Import failed"
+                }
+
+            total = first.get("paging", {}).get("total", 0)
+            item_ids = list(first.get("results", []))
+
+            sem = asyncio.Semaphore(settings.ML_CONCURRENCY)
+
+            async def fetch_page(offset: int) -> Optional[Dict]:
+                async with sem:
+                    return await ml_api.get_seller_items(
+                        offset=offset, limit=_IMPORT_PAGE
+                    )
+
+            pages = await asyncio.gather(
+                *[fetch_page(o) for o in range(_IMPORT_PAGE, total, _IMPORT_PAGE)],
+                return_exceptions=True
+            )
+            for page in pages:
+                if isinstance(page, Exception) or page is None:
+                    errors.append("Failed to fetch a seller items page")
+                else:
+                    item_ids.extend(page.get("results", []))
+
+            async def fetch_item(item_id: str) -> Optional[Dict]:
+                async with sem:
+                    return await ml_api.get_item(item_id)
+
+            items = await asyncio.gather(
+                *[fetch_item(item_id) for item_id in item_ids],
+                return_exceptions=True
+            )
+
+            # One IN() query resolves which items already exist locally
+            existing = {
+                p.ml_item_id: p
+                for p in self.db.query(Product).filter(
+                    Product.ml_item_id.in_(item_ids)
+                ).all()
+            }
+
+            for item_id, item in zip(item_ids, items):
+                if isinstance(item, Exception) or not item:
+                    errors.append(f"Failed to fetch item {item_id}")
+                    continue
+
+                product = existing.get(item["id"])
+                if product:
+                    product.final_price = item.get("price", product.final_price)
+                    product.stock = item.get("available_quantity", product.stock)
+                    updated += 1
+                else:
+                    self.db.add(Product(
+                        sku=item.get("seller_custom_field") or item["id"],
+                        name=item.get("title", ""),
+                        base_cost=item.get("price", 0.0),
+                        final_price=item.get("price"),
+                        stock=item.get("available_quantity", 0),
+                        ml_category_id=item.get("category_id"),
+                        ml_item_id=item["id"],
+                        ml_permalink=item.get("permalink"),
+                        images=[
+                            p["secure_url"] for p in item.get("pictures", [])
+                            if p.get("secure_url")
+                        ],
+                        status="published"
+                    ))
+                    imported += 1
+
+            self.db.commit()
+
             logger.info(f"ML import completed: {imported} imported, {updated} updated")
-            
+
             return {
                 "imported": imported,
                 "updated": updated,
                 "errors": errors,
                 "message": "Import from ML completed"
             }
-            
+
         except Exception as e:
             logger.error(f"Error importing from ML: {str(e)}")
+            self.db.rollback()
             return {
                 "imported": 0,
                 "updated": 0,
@@ -50,15 +135,19 @@ class SyncManager:
     
     async def sync_product_to_shopify(self, product_id: int) -> Optional[str]:
         """
-        Sync a single product to Shopify
+        Sync a single product to Shopify by id
         Returns: Shopify product ID if successful
         """
+        product = self.db.get(Product, product_id)
+        if not product:
+            logger.error(f"Product {product_id} not found")
+            return None
+
+        return await self._sync_product(product)
+
+    async def _sync_product(self, product: Product) -> Optional[str]:
+        """Sync an already-loaded product to Shopify"""
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
-            if not product:
-                logger.error(f"Product {product_id} not found")
-                return None
-            
             # Check if already exists in Shopify
             if product.shopify_product_id:
                 logger.info(f"Product {product.sku} already in Shopify, updating...")
@@ -109,19 +198,37 @@ class SyncManager:
         Sync all published products to Shopify
         """
         try:
-            products = self.db.query(Product).filter(
+            # One query loads products plus metrics/listings via IN(),
+            # and the worker gets the loaded instance instead of
+            # re-querying by id per product
+            products = self.db.query(Product).options(
+                selectinload(Product.metrics),
+                selectinload(Product.listings)
+            ).filter(
                 Product.status == "published"
             ).all()
-            
+
+            # Each sync is network-bound; fan out with bounded
+            # concurrency instead of awaiting products one by one
+            sem = asyncio.Semaphore(settings.ML_CONCURRENCY)
+
+            async def sync_one(product: Product) -> Optional[str]:
+                async with sem:
+                    return await self._sync_product(product)
+
+            results = await asyncio.gather(
+                *[sync_one(product) for product in products],
+                return_exceptions=True
+            )
+
             synced = 0
             errors = []
-            
-            for product in products:
-                shopify_id = await self.sync_product_to_shopify(product.id)
-                if shopify_id:
-                    synced += 1
-                else:
+
+            for product, result in zip(products, results):
+                if isinstance(result, Exception) or not result:
                     errors.append(f"Failed to sync {product.sku}")
+                else:
+                    synced += 1
             
             logger.info(f"Shopify sync completed: {synced}/{len(products)} products")
             
@@ -146,13 +253,15 @@ class SyncManager:
         Sync stock between ML and Shopify
         """
         try:
-            product = self.db.query(Product).filter(Product.id == product_id).first()
+            product = self.db.get(Product, product_id)
             if not product:
                 return False
             
             # Get stock from Shopify
             if product.shopify_product_id:
-                shopify_product = await shopify_api.get_product(product.shopify_product_id)
+                shopify_product = await shopify_api.get_product(
+                    product.shopify_product_id, fields="id,variants"
+                )
                 if shopify_product:
                     shopify_stock = shopify_product["variants"][0]["inventory_quantity"]
                     
@@ -1,18 +1,72 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config.settings import get_settings
 
 settings = get_settings()
 
+_is_sqlite = "sqlite" in settings.DATABASE_URL
+
 # Create engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+if _is_sqlite:
+    engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        query_cache_size=1200
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _):
+        """WAL journaling groups commits instead of fsyncing each one"""
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+else:
+    # Size the pool for bursty FastAPI traffic and drop stale
+    # connections before they fail a request
+    engine = create_engine(
+        settings.DATABASE_URL,
+        pool_size=20,
+        max_overflow=40,
+        pool_timeout=10,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        query_cache_size=1200
+    )
+
+if settings.DEBUG:
+    # Query accounting for development: repeated identical statements
+    # are the signature of an N+1 introduced by a lazy-load
+    from collections import Counter
+    from utils.logger import logger
+
+    _statement_counts = Counter()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_statements(conn, cursor, statement, parameters, context,
+                          executemany):
+        _statement_counts[statement] += 1
+        count = _statement_counts[statement]
+        if count in (10, 100, 1000):
+            logger.warning(
+                f"Statement executed {count} times (possible N+1): "
+                f"{statement[:120]}"
+            )
+
+    def reset_query_counts():
+        """Clear the per-statement counters (call between requests/jobs)"""
+        _statement_counts.clear()
 
 # Session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False keeps attribute state after commit instead of
+# re-SELECTing every object a handler returns; server defaults are
+# still populated at insert via RETURNING
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 # Base
 Base = declarative_base()
@@ -25,7 +79,101 @@ def get_db():
     finally:
         db.close()
 
+def _migrate_schema():
+    """Bring databases created by older builds up to the current models.
+
+    create_all only creates missing tables; columns and indexes added
+    to a table that already exists have to be applied here. Every step
+    checks the live schema first, so reruns are no-ops.
+    """
+    from sqlalchemy import LargeBinary, inspect, text
+    from database.models import Base
+
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        # Denormalized listing totals, read by every A/B evaluation
+        listing_cols = {c["name"] for c in inspector.get_columns("listings")}
+        total_cols = {
+            "total_visits": "INTEGER DEFAULT 0",
+            "total_sales": "INTEGER DEFAULT 0",
+            "total_revenue": "FLOAT DEFAULT 0"
+        }
+        missing = [col for col in total_cols if col not in listing_cols]
+        for col in missing:
+            conn.execute(text(
+                f"ALTER TABLE listings ADD COLUMN {col} {total_cols[col]}"
+            ))
+
+        if missing:
+            # Backfill from the metrics history so the running totals
+            # start correct instead of at zero
+            conn.execute(text("""
+                UPDATE listings SET
+                    total_visits = COALESCE((SELECT SUM(visits)
+                        FROM listing_metrics m
+                        WHERE m.listing_id = listings.id), 0),
+                    total_sales = COALESCE((SELECT SUM(sales)
+                        FROM listing_metrics m
+                        WHERE m.listing_id = listings.id), 0),
+                    total_revenue = COALESCE((SELECT SUM(revenue)
+                        FROM listing_metrics m
+                        WHERE m.listing_id = listings.id), 0)
+            """))
+
+        # Database-computed commission column. Baseline schemas have it
+        # as a plain FLOAT that nothing writes anymore, so it would stay
+        # NULL forever; rebuild it as a generated column (no data to
+        # preserve — the application never populated it)
+        product_cols = {c["name"]: c for c in inspector.get_columns("products")}
+        commission = product_cols.get("ml_commission_amount")
+        if commission is None or not commission.get("computed"):
+            if commission is not None:
+                conn.execute(text(
+                    "ALTER TABLE products DROP COLUMN ml_commission_amount"
+                ))
+            expr = "final_price * ml_commission_percentage / 100.0"
+            if _is_sqlite:
+                # SQLite cannot ADD a STORED generated column; VIRTUAL
+                # computes on read, which is equivalent for a derived
+                # value that is never written directly
+                conn.execute(text(
+                    "ALTER TABLE products ADD COLUMN ml_commission_amount "
+                    f"FLOAT GENERATED ALWAYS AS ({expr}) VIRTUAL"
+                ))
+            else:
+                conn.execute(text(
+                    "ALTER TABLE products ADD COLUMN ml_commission_amount "
+                    f"FLOAT GENERATED ALWAYS AS ({expr}) STORED"
+                ))
+
+        if not _is_sqlite:
+            # Pre-compression Postgres schemas hold top_competitors as
+            # json, which rejects the zlib bytes CompressedJSON binds.
+            # Convert it to bytea; old rows become uncompressed JSON
+            # bytes, which the read guard decodes. SQLite needs nothing
+            # thanks to type affinity
+            comp_cols = {
+                c["name"]: c
+                for c in inspector.get_columns("competitor_analyses")
+            }
+            top = comp_cols.get("top_competitors")
+            if top is not None and not isinstance(top["type"], LargeBinary):
+                conn.execute(text(
+                    "ALTER TABLE competitor_analyses "
+                    "ALTER COLUMN top_competitors TYPE bytea "
+                    "USING convert_to(top_competitors::text, 'UTF8')"
+                ))
+
+    # Indexes declared after a table already existed
+    for table in Base.metadata.tables.values():
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+
 def init_db():
     """Initialize database"""
     from database.models import Base
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
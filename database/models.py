@@ -1,11 +1,69 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, JSON, Index, LargeBinary, func, text, Computed
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 from database.db import Base
+import orjson
+import zlib
+
+class CompressedJSON(TypeDecorator):
+    """JSON stored as a zlib-compressed orjson blob.
+
+    Cuts row size for bulky payloads (competitor lists are ~1-2 KB as
+    plain JSON) and decodes faster than the stdlib json round-trip.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zlib.compress(orjson.dumps(value), 6)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # Rows written before compression was introduced hold plain
+        # JSON (str, or already-decoded by a native JSON column)
+        if isinstance(value, (dict, list)):
+            return value
+        if isinstance(value, str):
+            return orjson.loads(value)
+        try:
+            return orjson.loads(zlib.decompress(value))
+        except zlib.error:
+            return orjson.loads(value)
 
 class Product(Base):
     __tablename__ = "products"
-    
+    __table_args__ = (
+        # Scheduler sweeps and the dashboard filter on status, ordered
+        # or ranked by score/recency; give the planner range scans
+        Index("ix_products_status_score", "status", "score"),
+        Index("ix_products_status_updated", "status", "updated_at"),
+        # Keyset pagination on the dashboard tables filters by status
+        # and walks created_at descending
+        Index("ix_products_status_created", "status", "created_at"),
+        # The 15-minute stock sync selects published products that
+        # exist in Shopify
+        Index("ix_products_status_shopify", "status", "shopify_product_id"),
+        # Partial index for the auto-publish sweep; it only ever holds
+        # the handful of rows waiting to be published. The predicate
+        # mirrors the emitted SQL exactly so both planners can match it
+        Index(
+            "ix_products_pending_publish", "id",
+            sqlite_where=text(
+                "status = 'approved' AND auto_approved = 1 "
+                "AND ml_item_id IS NULL"
+            ),
+            postgresql_where=text(
+                "status = 'approved' AND auto_approved "
+                "AND ml_item_id IS NULL"
+            ),
+        ),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     sku = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
@@ -29,9 +87,14 @@ class Product(Base):
     
     # Costs
     ml_commission_percentage = Column(Float)
-    ml_commission_amount = Column(Float)
+    # Derived in the database so dashboards read it without a Python
+    # recompute and updates skip one column
+    ml_commission_amount = Column(
+        Float,
+        Computed("final_price * ml_commission_percentage / 100.0", persisted=True)
+    )
     shipping_cost = Column(Float, default=0)
-    
+
     # Status
     status = Column(String, default="pending")  # pending, needs_approval, approved, published, paused, killed
     score = Column(Integer, default=0)
@@ -41,15 +104,21 @@ class Product(Base):
     images = Column(JSON)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # created_at is indexed alone for the unfiltered newest-first scans
+    # (dashboard recent products, keyset pages with status=all)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=datetime.utcnow)
     published_at = Column(DateTime, nullable=True)
     
     # Relationships
-    listings = relationship("Listing", back_populates="product", cascade="all, delete-orphan")
-    metrics = relationship("ProductMetrics", back_populates="product", uselist=False, cascade="all, delete-orphan")
-    competitor_analyses = relationship("CompetitorAnalysis", back_populates="product", cascade="all, delete-orphan")
-    actions = relationship("ActionLog", back_populates="product", cascade="all, delete-orphan")
+    # metrics is wanted almost everywhere a product is, so it loads
+    # via one IN() query per batch; the collection relationships raise
+    # instead of silently lazy-loading per row — callers opt in with
+    # selectinload/joinedload
+    listings = relationship("Listing", back_populates="product", cascade="all, delete-orphan", lazy="raise_on_sql")
+    metrics = relationship("ProductMetrics", back_populates="product", uselist=False, cascade="all, delete-orphan", lazy="selectin")
+    competitor_analyses = relationship("CompetitorAnalysis", back_populates="product", cascade="all, delete-orphan", lazy="raise_on_sql")
+    actions = relationship("ActionLog", back_populates="product", cascade="all, delete-orphan", lazy="raise_on_sql")
 
 
 class Listing(Base):
@@ -74,13 +143,19 @@ class Listing(Base):
     is_ab_test = Column(Boolean, default=False)
     ab_variant = Column(String)  # A, B
     ab_test_id = Column(Integer, ForeignKey("ab_tests.id"), nullable=True)
+
+    # Running totals, kept in sync when a ListingMetrics row is written
+    # so evaluations read one row instead of aggregating the history
+    total_visits = Column(Integer, default=0)
+    total_sales = Column(Integer, default=0)
+    total_revenue = Column(Float, default=0)
     
     # Status
     status = Column(String, default="active")  # active, paused, ended
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=datetime.utcnow)
     ended_at = Column(DateTime, nullable=True)
     
     # Relationships
@@ -109,8 +184,8 @@ class ProductMetrics(Base):
     last_sale_date = Column(DateTime, nullable=True)
     
     # Timestamps
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=datetime.utcnow)
+
     # Relationships
     product = relationship("Product", back_populates="metrics")
 
@@ -119,8 +194,8 @@ class ListingMetrics(Base):
     __tablename__ = "listing_metrics"
     
     id = Column(Integer, primary_key=True, index=True)
-    listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False)
-    date = Column(DateTime, default=datetime.utcnow)
+    listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False, index=True)
+    date = Column(DateTime, server_default=func.now(), index=True)
     
     # Daily metrics
     visits = Column(Integer, default=0)
@@ -138,7 +213,12 @@ class ListingMetrics(Base):
 
 class CompetitorAnalysis(Base):
     __tablename__ = "competitor_analyses"
-    
+    __table_args__ = (
+        # Serves the "latest analysis per product" query with an index
+        # seek instead of a table scan
+        Index("ix_competitor_product_created", "product_id", "created_at"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     keyword = Column(String, nullable=False)
@@ -150,12 +230,12 @@ class CompetitorAnalysis(Base):
     competition_level = Column(String)  # low, medium, high
     
     # Top competitors
-    top_competitors = Column(JSON)  # List of competitor items
+    top_competitors = Column(CompressedJSON)  # List of competitor items
     free_shipping_percentage = Column(Float)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
+    created_at = Column(DateTime, server_default=func.now())
+
     # Relationships
     product = relationship("Product", back_populates="competitor_analyses")
 
@@ -179,13 +259,40 @@ class ABTest(Base):
     results = Column(JSON)
     
     # Timestamps
-    started_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, server_default=func.now())
     ended_at = Column(DateTime, nullable=True)
-    
+
+    # Relationships
+    product = relationship("Product")
+    variant_a = relationship("Listing", foreign_keys=[variant_a_id])
+    variant_b = relationship("Listing", foreign_keys=[variant_b_id])
+
+
+class UploadJob(Base):
+    __tablename__ = "upload_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, nullable=False)
+
+    # Progress
+    status = Column(String, default="pending")  # pending, processing, done, failed
+    created_count = Column(Integer, default=0)
+    errors = Column(JSON)
+
+    # Timestamps
+    created_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
 
 class ActionLog(Base):
     __tablename__ = "action_logs"
-    
+    __table_args__ = (
+        # Per-product action history is read newest-first
+        Index("ix_actionlogs_product_created", "product_id", "created_at"),
+        # /api/actions filters by type and walks created_at descending
+        Index("ix_actionlogs_type_created", "action_type", "created_at"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
     
@@ -200,7 +307,7 @@ class ActionLog(Base):
     error_message = Column(Text, nullable=True)
     
     # Timestamp
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
     # Relationships
     product = relationship("Product", back_populates="actions")
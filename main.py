@@ -1,20 +1,15 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.templating import Jinja2Templates
 from contextlib import asynccontextmanager
 import uvicorn
 import os
-from pathlib import Path
 
 from database.db import init_db
 from routes import products, dashboard, actions
 from scheduler.jobs import job_scheduler
 from utils.logger import logger
 
-# Templates directory
-TEMPLATES_DIR = Path(__file__).parent / "templates"
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
@@ -28,6 +23,21 @@ async def lifespan(app: FastAPI):
     # Start scheduler
     job_scheduler.start()
     logger.info("✅ Job scheduler started")
+
+    # Start background sheets writer
+    from api.google_sheets import sheets_queue
+    if sheets_queue:
+        sheets_queue.start()
+        logger.info("✅ Sheets sync queue started")
+
+    # Start background action-log writer
+    from core.action_log import action_log_batcher
+    action_log_batcher.start()
+    logger.info("✅ Action log batcher started")
+
+    # Pre-compile dashboard templates
+    dashboard.prime_templates()
+    logger.info("✅ Templates compiled")
     
     logger.info("✅ System ready!")
     
@@ -37,6 +47,17 @@ async def lifespan(app: FastAPI):
     logger.info("👋 Shutting down ML Automation System...")
     job_scheduler.shutdown()
 
+    if sheets_queue:
+        await sheets_queue.stop()
+
+    await action_log_batcher.stop()
+
+    # Close pooled HTTP clients
+    from api.mercadolibre import ml_api
+    from api.shopify import shopify_api
+    await ml_api.aclose()
+    await shopify_api.aclose()
+
 # Create app
 app = FastAPI(
     title="ML Automation System",
@@ -1,12 +1,25 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session, raiseload
 from sqlalchemy import func
 from typing import List, Dict
+from config.settings import get_settings
 from database.db import get_db
 from database.models import ActionLog
 from pydantic import BaseModel
+from datetime import datetime
+import time
 
-router = APIRouter(prefix="/api/actions", tags=["actions"])
+settings = get_settings()
+
+router = APIRouter(
+    prefix="/api/actions", tags=["actions"],
+    default_response_class=ORJSONResponse
+)
+
+# Action counts drift slowly; serve dashboard polls from a short cache
+_SUMMARY_TTL = 5.0
+_summary_cache = {"at": 0.0, "value": None}
 
 class ActionResponse(BaseModel):
     id: int
@@ -14,8 +27,10 @@ class ActionResponse(BaseModel):
     action_type: str
     reason: str = None
     success: bool
-    created_at: str
-    
+    # datetime rather than str: orjson emits ISO-8601 natively, so no
+    # per-row cast is needed
+    created_at: datetime
+
     class Config:
         from_attributes = True
 
@@ -28,7 +43,12 @@ def list_actions(
 ):
     """List action logs"""
     query = db.query(ActionLog)
-    
+
+    if settings.DEBUG:
+        # Serialization only reads columns; a lazy load here is an N+1
+        # regression, so make it fail loudly in development
+        query = query.options(raiseload("*"))
+
     if action_type:
         query = query.filter(ActionLog.action_type == action_type)
     
@@ -37,13 +57,19 @@ def list_actions(
 
 @router.get("/summary")
 def actions_summary(db: Session = Depends(get_db)) -> Dict:
-    """Get summary of actions"""
-    
+    """Get summary of actions (cached for a few seconds)"""
+    now = time.time()
+    if _summary_cache["value"] is not None and now - _summary_cache["at"] < _SUMMARY_TTL:
+        return _summary_cache["value"]
+
     summary = db.query(
         ActionLog.action_type,
         func.count(ActionLog.id).label('count')
     ).group_by(ActionLog.action_type).all()
-    
-    return {
+
+    result = {
         "summary": [{"action_type": s[0], "count": s[1]} for s in summary]
     }
+    _summary_cache["at"] = now
+    _summary_cache["value"] = result
+    return result
@@ -1,40 +1,176 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from pathlib import Path
-from database.db import get_db
+import hashlib
+from sqlalchemy import String, and_, func, literal, or_, text, tuple_
+from sqlalchemy.orm import Session, load_only, raiseload
+from typing import Optional
+from datetime import datetime
+import time
+from database.db import get_db, engine
 from database.models import Product, ActionLog
+from routes.templating import templates, prime_templates
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
-# Templates
-TEMPLATES_DIR = Path(__file__).parent.parent / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+_IS_POSTGRES = engine.dialect.name == "postgresql"
+
+# On a remote Postgres the dashboard's stats + recent-products queries
+# each cost a network round trip; one CTE statement returns both as
+# JSON blobs. SQLite is in-process, so it keeps the plain queries.
+_DASHBOARD_SQL = text("""
+    WITH stats AS (
+        SELECT status, count(*) AS c FROM products GROUP BY status
+    ),
+    recent AS (
+        SELECT id, sku, name, status, final_price
+        FROM products ORDER BY created_at DESC LIMIT 10
+    )
+    SELECT
+        (SELECT coalesce(json_object_agg(status, c), '{}'::json) FROM stats),
+        (SELECT coalesce(json_agg(recent), '[]'::json) FROM recent)
+""")
+
+# Columns the product table templates actually render
+_TABLE_COLUMNS = load_only(
+    Product.id, Product.sku, Product.name, Product.status, Product.score,
+    Product.final_price, Product.margin_percentage, Product.stock,
+    Product.images, Product.created_at
+)
+
+# Rows per dashboard table page
+_PAGE_SIZE = 50
+
+# Status counts change only on product transitions; cache the stats
+# block briefly so concurrent dashboard loads share one query
+_STATS_TTL = 5.0
+_stats_cache = {"at": 0.0, "stats": None}
+
+def _get_stats(db: Session) -> dict:
+    """Status-count stats for the dashboard header, TTL-cached"""
+    now = time.time()
+    if _stats_cache["stats"] is not None and now - _stats_cache["at"] < _STATS_TTL:
+        return _stats_cache["stats"]
+
+    status_counts = dict(
+        db.query(Product.status, func.count(Product.id))
+        .group_by(Product.status).all()
+    )
+    stats = {
+        "total": sum(status_counts.values()),
+        "published": status_counts.get("published", 0),
+        "pending": status_counts.get("pending", 0),
+        "needs_approval": status_counts.get("needs_approval", 0)
+    }
+    _stats_cache["at"] = now
+    _stats_cache["stats"] = stats
+    return stats
+
+def invalidate_stats_cache():
+    """Drop the cached stats after a product status transition"""
+    _stats_cache["stats"] = None
+
+def _dashboard_data(db: Session):
+    """Stats plus the 10 most recent products for the home page.
+
+    Postgres gets both in a single CTE round trip; the recent rows come
+    back as JSON dicts, which the template reads the same way as ORM
+    instances. SQLite falls back to the TTL-cached stats query plus the
+    ORM recent-products query.
+    """
+    if _IS_POSTGRES:
+        counts, recent = db.execute(_DASHBOARD_SQL).one()
+        stats = {
+            "total": sum(counts.values()),
+            "published": counts.get("published", 0),
+            "pending": counts.get("pending", 0),
+            "needs_approval": counts.get("needs_approval", 0)
+        }
+        return stats, recent or []
+
+    recent = (
+        db.query(Product).options(_TABLE_COLUMNS, raiseload(Product.metrics))
+        .order_by(Product.created_at.desc()).limit(10).all()
+    )
+    return _get_stats(db), recent
+
+def _products_etag(db: Session) -> str:
+    """Cheap content tag for pages derived from the products table"""
+    tag = db.query(func.max(Product.updated_at), func.count(Product.id)).one()
+    return hashlib.md5(str(tag).encode()).hexdigest()
+
+def _etag_headers(response, etag: str):
+    """Mark a rendered page as revalidatable for a few seconds"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, max-age=5"
+    return response
+
+def _parse_cursor(cursor: Optional[str]):
+    """Decode a "<created_at isoformat>_<id>" keyset cursor"""
+    if not cursor:
+        return None
+    try:
+        ts_part, _, id_part = cursor.rpartition("_")
+        return datetime.fromisoformat(ts_part), int(id_part)
+    except ValueError:
+        # Malformed cursor: serve the first page
+        return None
+
+def _paginate(query, cursor: Optional[str], limit: int):
+    """Keyset-paginate a (created_at, id)-ordered product query.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Keyset beats OFFSET here because deep pages stay an index range
+    scan instead of skipping rows. The id tiebreaker matters: bulk
+    inserts share one server-default timestamp, so a bare created_at
+    cursor would repeat or skip every tied row.
+    """
+    position = _parse_cursor(cursor)
+    if position:
+        ts, last_id = position
+        if _IS_POSTGRES:
+            query = query.filter(
+                tuple_(Product.created_at, Product.id) < tuple_(ts, last_id)
+            )
+        else:
+            # SQLite stores the server-default timestamps at second
+            # precision; bind the cursor in that same textual format,
+            # or tied rows never compare equal and keep matching "<"
+            ts_text = literal(ts.strftime("%Y-%m-%d %H:%M:%S"), String)
+            query = query.filter(or_(
+                Product.created_at < ts_text,
+                and_(Product.created_at == ts_text, Product.id < last_id)
+            ))
+
+    rows = (
+        query.order_by(Product.created_at.desc(), Product.id.desc())
+        .limit(limit + 1).all()
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f"{last.created_at.isoformat()}_{last.id}"
+
+    return rows, next_cursor
 
 @router.get("/", response_class=HTMLResponse)
 def dashboard_home(request: Request, db: Session = Depends(get_db)):
     """Main dashboard - ORVIA style"""
-    
-    # Stats
-    total_products = db.query(Product).count()
-    published = db.query(Product).filter(Product.status == "published").count()
-    pending = db.query(Product).filter(Product.status == "pending").count()
-    needs_approval = db.query(Product).filter(Product.status == "needs_approval").count()
-    
-    # Recent products
-    recent_products = db.query(Product).order_by(Product.created_at.desc()).limit(10).all()
-    
-    return templates.TemplateResponse("dashboard_home.html", {
+
+    # Skip the queries and the render entirely when the client already
+    # holds the current version
+    etag = _products_etag(db)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
+
+    stats, recent_products = _dashboard_data(db)
+
+    return _etag_headers(templates.TemplateResponse("dashboard_home.html", {
         "request": request,
-        "stats": {
-            "total": total_products,
-            "published": published,
-            "pending": pending,
-            "needs_approval": needs_approval
-        },
+        "stats": stats,
         "recent_products": recent_products
-    })
+    }), etag)
 
 @router.get("/create-product", response_class=HTMLResponse)
 def create_product_page(request: Request):
@@ -51,27 +187,33 @@ def upload_products_page(request: Request):
     })
 
 @router.get("/review-products", response_class=HTMLResponse)
-def review_products_page(request: Request, status: str = "needs_approval", db: Session = Depends(get_db)):
+def review_products_page(
+    request: Request,
+    status: str = "needs_approval",
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """Review and approve products page"""
-    
-    query = db.query(Product)
-    
+
+    query = db.query(Product).options(_TABLE_COLUMNS, raiseload(Product.metrics))
+
     if status != "all":
         query = query.filter(Product.status == status)
-    
-    products = query.order_by(Product.created_at.desc()).all()
-    
+
+    products, next_cursor = _paginate(query, cursor, _PAGE_SIZE)
+
     return templates.TemplateResponse("review_products.html", {
         "request": request,
         "products": products,
-        "filter_status": status
+        "filter_status": status,
+        "next_cursor": next_cursor
     })
 
 @router.get("/product/{product_id}", response_class=HTMLResponse)
 def product_detail_page(request: Request, product_id: int, db: Session = Depends(get_db)):
     """Product detail page"""
     
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = db.get(Product, product_id)
     
     if not product:
         return templates.TemplateResponse("error.html", {
@@ -85,20 +227,39 @@ def product_detail_page(request: Request, product_id: int, db: Session = Depends
     })
 
 @router.get("/products", response_class=HTMLResponse)
-def dashboard_products(request: Request, status: str = None, db: Session = Depends(get_db)):
-    """Products management page"""
-    
-    query = db.query(Product)
-    if status:
-        query = query.filter(Product.status == status)
-    
-    products = query.order_by(Product.created_at.desc()).all()
-    
-    return templates.TemplateResponse("products.html", {
+def dashboard_products(
+    request: Request,
+    status: str = None,
+    cursor: Optional[str] = None,
+    ssr: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Products management page.
+
+    By default renders a shell and the table loads client-side from
+    /api/products, so Jinja never iterates rows; ?ssr=1 keeps the
+    paginated server-side render.
+    """
+    etag = _products_etag(db)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
+
+    products = []
+    next_cursor = None
+
+    if ssr:
+        query = db.query(Product).options(_TABLE_COLUMNS, raiseload(Product.metrics))
+        if status:
+            query = query.filter(Product.status == status)
+        products, next_cursor = _paginate(query, cursor, _PAGE_SIZE)
+
+    return _etag_headers(templates.TemplateResponse("products.html", {
         "request": request,
         "products": products,
-        "filter_status": status
-    })
+        "filter_status": status,
+        "next_cursor": next_cursor,
+        "ssr": ssr
+    }), etag)
 
 @router.get("/analytics", response_class=HTMLResponse)
 def dashboard_analytics(request: Request, db: Session = Depends(get_db)):
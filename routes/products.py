@@ -1,14 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, File, UploadFile
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.orm import Session, load_only, raiseload
 from typing import List, Optional
-from database.db import get_db
-from database.models import Product
+from datetime import datetime
+from config.settings import get_settings
+from database.db import get_db, SessionLocal
+from database.models import Product, UploadJob
 from core.product_manager import ProductManager
+from routes.dashboard import invalidate_stats_cache
+from utils.logger import logger
 from pydantic import BaseModel
+import codecs
 import csv
-import io
+import os
+import shutil
+import tempfile
 
-router = APIRouter(prefix="/api/products", tags=["products"])
+settings = get_settings()
+
+# orjson encodes the list payloads (floats, datetimes) several times
+# faster than the default JSON encoder
+router = APIRouter(
+    prefix="/api/products", tags=["products"],
+    default_response_class=ORJSONResponse
+)
+
+def get_product_manager(db: Session = Depends(get_db)) -> ProductManager:
+    """Request-scoped ProductManager.
+
+    FastAPI caches dependencies within a request, so every handler
+    parameter resolves to the same instance (and the same session as
+    get_db); any future init cost is paid once per request, not per
+    construction site.
+    """
+    return ProductManager(db)
 
 class ProductCreate(BaseModel):
     sku: str
@@ -38,24 +65,27 @@ class ProductResponse(BaseModel):
         from_attributes = True
 
 @router.post("/", response_model=ProductResponse)
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+def create_product(
+    product: ProductCreate,
+    manager: ProductManager = Depends(get_product_manager)
+):
     """Create new product"""
-    manager = ProductManager(db)
-    
     new_product = manager.create_product(product.dict())
     if not new_product:
         raise HTTPException(status_code=400, detail="Failed to create product")
     
-    # Calculate pricing and score
+    # Calculate pricing and score; the session identity map hands the
+    # same instance back, so no explicit refresh round trip is needed
     manager.calculate_and_score(new_product.id)
-    
-    db.refresh(new_product)
+
     return new_product
 
 @router.post("/optimize-title")
-async def optimize_title(request: TitleOptimizeRequest, db: Session = Depends(get_db)):
+async def optimize_title(
+    request: TitleOptimizeRequest,
+    manager: ProductManager = Depends(get_product_manager)
+):
     """Optimize product title for Mercado Libre"""
-    manager = ProductManager(db)
     optimized = await manager.optimize_title(request.title)
     
     if not optimized:
@@ -78,49 +108,94 @@ def list_products(
     db: Session = Depends(get_db)
 ):
     """List products"""
-    query = db.query(Product)
-    
+    # Fetch only the columns ProductResponse serializes; the wide
+    # columns (images JSON, description) dominate row size otherwise
+    query = db.query(Product).options(load_only(
+        Product.id, Product.sku, Product.name, Product.status,
+        Product.score, Product.final_price, Product.margin_percentage,
+        Product.ml_item_id
+    ))
+
+    if settings.DEBUG:
+        # Serialization only reads columns; a lazy load here is an N+1
+        # regression, so make it fail loudly in development
+        query = query.options(raiseload("*"))
+
     if status:
         query = query.filter(Product.status == status)
     
     products = query.offset(skip).limit(limit).all()
     return products
 
+# Registered before /{product_id} so "jobs" is not parsed as an id
+@router.get("/jobs/{job_id}")
+def get_upload_job(job_id: int, db: Session = Depends(get_db)):
+    """Get upload job status"""
+    job = db.get(UploadJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "created": job.created_count,
+        "errors": job.errors or []
+    }
+
 @router.get("/{product_id}", response_model=ProductResponse)
 def get_product(product_id: int, db: Session = Depends(get_db)):
     """Get product by ID"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 @router.post("/{product_id}/calculate")
-def recalculate_product(product_id: int, db: Session = Depends(get_db)):
+def recalculate_product(
+    product_id: int,
+    db: Session = Depends(get_db),
+    manager: ProductManager = Depends(get_product_manager)
+):
     """Recalculate pricing and score"""
-    manager = ProductManager(db)
     success = manager.calculate_and_score(product_id)
     
     if not success:
         raise HTTPException(status_code=400, detail="Failed to calculate")
     
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = db.get(Product, product_id)
     return product
 
 @router.post("/{product_id}/approve")
-async def approve_product(product_id: int, db: Session = Depends(get_db)):
+async def approve_product(
+    product_id: int,
+    db: Session = Depends(get_db),
+    manager: ProductManager = Depends(get_product_manager)
+):
     """Manually approve product and auto-publish if score >= 80"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    # One UPDATE..RETURNING instead of a SELECT-then-mutate round trip;
+    # the returned score drives the auto-publish decision. Runs in the
+    # threadpool so the blocking commit never stalls the event loop
+    def _approve():
+        row = db.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(status="approved")
+            .returning(Product.score)
+        ).first()
+        if row is not None:
+            db.commit()
+        return row
+
+    row = await run_in_threadpool(_approve)
+    if row is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    product.status = "approved"
-    db.commit()
-    
-    manager = ProductManager(db)
+    invalidate_stats_cache()
+
     manager.log_action(product_id, "approved", reason="Manual approval")
-    
+
     # Auto-publish if score >= 80
-    if product.score >= 80:
+    if row.score >= 80:
         ml_item_id = await manager.publish_to_ml(product_id)
         if ml_item_id:
             return {
@@ -137,81 +212,165 @@ async def approve_product(product_id: int, db: Session = Depends(get_db)):
     }
 
 @router.post("/{product_id}/reject")
-def reject_product(product_id: int, reason: str = None, db: Session = Depends(get_db)):
+def reject_product(
+    product_id: int,
+    reason: str = None,
+    db: Session = Depends(get_db),
+    manager: ProductManager = Depends(get_product_manager)
+):
     """Reject product"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    row = db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(status="rejected")
+        .returning(Product.id)
+    ).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    product.status = "rejected"
     db.commit()
-    
-    manager = ProductManager(db)
+    invalidate_stats_cache()
+
     manager.log_action(product_id, "rejected", reason=reason)
     
     return {"message": "Product rejected", "product_id": product_id}
 
 @router.post("/{product_id}/publish")
-async def publish_product(product_id: int, db: Session = Depends(get_db)):
+async def publish_product(
+    product_id: int,
+    manager: ProductManager = Depends(get_product_manager)
+):
     """Publish product to Mercado Libre"""
-    manager = ProductManager(db)
     ml_item_id = await manager.publish_to_ml(product_id)
-    
+
     if not ml_item_id:
         raise HTTPException(status_code=400, detail="Failed to publish")
-    
+
+    invalidate_stats_cache()
     return {
         "message": "Product published",
         "product_id": product_id,
         "ml_item_id": ml_item_id
     }
 
-@router.post("/bulk-upload")
-async def bulk_upload(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Bulk upload products from CSV"""
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files allowed")
-    
-    content = await file.read()
-    csv_file = io.StringIO(content.decode('utf-8'))
-    reader = csv.DictReader(csv_file)
-    
+# Rows buffered per insert/score pass during CSV upload
+_UPLOAD_BATCH = 1000
+
+def _process_upload_job(job_id: int, tmp_path: str):
+    """Run a CSV upload job on its own session.
+
+    Stream-decodes the spooled file and inserts/scores rows in batches
+    of _UPLOAD_BATCH so a large CSV issues a handful of commits instead
+    of two queries per row, with memory bounded by the batch size.
+    """
+    db = SessionLocal()
     manager = ProductManager(db)
     created = 0
     errors = []
-    
-    for row in reader:
-        try:
-            product_data = {
-                "sku": row["sku"],
-                "name": row["name"],
-                "description": row.get("description"),
-                "base_cost": float(row["base_cost"]),
-                "shipping_cost": float(row.get("shipping_cost", 0)),
-                "stock": int(row.get("stock", 0)),
-                "category": row.get("category"),
-                "listing_type": row.get("listing_type", "gold_special"),
-                "images": row.get("images", "").split("|") if row.get("images") else []
-            }
-            
-            product = manager.create_product(product_data)
-            if product:
-                manager.calculate_and_score(product.id)
-                created += 1
-            
-        except Exception as e:
-            errors.append(f"Row {reader.line_num}: {str(e)}")
-    
+    batch = []
+
+    def flush_batch():
+        nonlocal created
+        new_ids = manager.bulk_create_product_ids(batch)
+        if new_ids:
+            manager.bulk_calculate_and_score(new_ids)
+            created += len(new_ids)
+        batch.clear()
+
+    try:
+        with open(tmp_path, "rb") as f:
+            # Plain csv.reader with positional column lookups resolved
+            # once from the header: no per-row dict construction or
+            # key hashing, which dominates DictReader cost at 50k rows
+            reader = csv.reader(codecs.iterdecode(f, "utf-8"))
+            header = next(reader, None)
+            if header is None:
+                raise ValueError("Empty CSV file")
+
+            idx = {name: i for i, name in enumerate(header)}
+            i_sku, i_name, i_cost = idx["sku"], idx["name"], idx["base_cost"]
+            i_ship = idx.get("shipping_cost")
+            i_stock = idx.get("stock")
+            i_cat = idx.get("category")
+            i_img = idx.get("images")
+
+            for row in reader:
+                try:
+                    images = row[i_img] if i_img is not None else ""
+                    batch.append({
+                        "sku": row[i_sku],
+                        "name": row[i_name],
+                        "base_cost": float(row[i_cost]),
+                        "shipping_cost": float(row[i_ship]) if i_ship is not None and row[i_ship] else 0.0,
+                        "stock": int(row[i_stock]) if i_stock is not None and row[i_stock] else 0,
+                        "category": row[i_cat] if i_cat is not None and row[i_cat] else None,
+                        "images": images.split("|") if images else []
+                    })
+                except Exception as e:
+                    errors.append(f"Row {reader.line_num}: {str(e)}")
+
+                if len(batch) >= _UPLOAD_BATCH:
+                    flush_batch()
+
+        if batch:
+            flush_batch()
+
+        status = "done"
+
+    except Exception as e:
+        logger.error(f"Upload job {job_id} failed: {str(e)}")
+        db.rollback()
+        status = "failed"
+        errors.append(str(e))
+
+    finally:
+        job = db.get(UploadJob, job_id)
+        if job:
+            job.status = status
+            job.created_count = created
+            job.errors = errors
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        db.close()
+        os.unlink(tmp_path)
+
+@router.post("/bulk-upload", status_code=202)
+async def bulk_upload(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """Queue a CSV bulk upload and return a job id immediately"""
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Only CSV files allowed")
+
+    # Spool the upload to disk: the request file is closed once the
+    # response is sent, before the background task runs. Both the disk
+    # copy and the job insert are blocking, so keep them off the loop
+    fd, tmp_path = tempfile.mkstemp(suffix=".csv")
+
+    def _spool_and_record() -> UploadJob:
+        with os.fdopen(fd, "wb") as tmp:
+            shutil.copyfileobj(file.file, tmp)
+        job = UploadJob(filename=file.filename, status="pending")
+        db.add(job)
+        db.commit()
+        return job
+
+    job = await run_in_threadpool(_spool_and_record)
+
+    background_tasks.add_task(_process_upload_job, job.id, tmp_path)
+
     return {
-        "message": f"Uploaded {created} products",
-        "created": created,
-        "errors": errors
+        "message": "Upload queued",
+        "job_id": job.id,
+        "status_url": f"/api/products/jobs/{job.id}"
     }
 
+
 @router.delete("/{product_id}")
 def delete_product(product_id: int, db: Session = Depends(get_db)):
     """Delete product"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
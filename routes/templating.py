@@ -0,0 +1,25 @@
+from fastapi.templating import Jinja2Templates
+from pathlib import Path
+
+# One Jinja environment for the whole process; route modules import
+# this instead of building their own
+TEMPLATES_DIR = Path(__file__).parent.parent / "templates"
+templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+
+# Pages rendered on the hot dashboard paths
+_HOT_TEMPLATES = (
+    "dashboard_home.html", "products.html", "review_products.html",
+    "product_detail.html", "analytics.html", "create_product.html",
+    "upload_products.html"
+)
+
+def prime_templates():
+    """Compile the dashboard templates once at startup.
+
+    Disables per-request file stat checks and keeps every compiled
+    template cached, so no render pays the compile or stat cost.
+    """
+    templates.env.auto_reload = False
+    templates.env.cache_size = -1
+    for name in _HOT_TEMPLATES:
+        templates.env.get_template(name)
@@ -1,22 +1,89 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from database.db import SessionLocal
+from sqlalchemy import func, select, text
+from database.db import SessionLocal, engine
 from database.models import Product
 from core.product_manager import ProductManager
 from core.optimizer import PerformanceOptimizer
 from core.ab_testing import ABTestManager
 from api.mercadolibre import ml_api
-from api.google_sheets import sheets_api
+from api.google_sheets import sheets_api, sheets_queue
 from utils.logger import logger
 from utils.notifications import notify_error
 import asyncio
+import functools
+import time
+
+_IS_POSTGRES = engine.dialect.name == "postgresql"
+
+# On Postgres the hourly sheets export is formatted by the server:
+# json_agg returns both payloads as two ready-made JSON arrays in one
+# round trip, with no per-row Python dict building. SQLite keeps the
+# streamed column select.
+_SHEETS_EXPORT_SQL = text("""
+    SELECT
+        (SELECT coalesce(json_agg(jsonb_build_object(
+            'sku', sku, 'name', name, 'status', status, 'score', score,
+            'ml_item_id', coalesce(ml_item_id, ''),
+            'price', coalesce(final_price, 0),
+            'margin', coalesce(margin_percentage, 0),
+            'updated_at', to_char(updated_at, 'YYYY-MM-DD"T"HH24:MI:SS')
+        )), '[]'::json) FROM products),
+        (SELECT coalesce(json_agg(jsonb_build_object(
+            'created_at', to_char(a.created_at, 'YYYY-MM-DD"T"HH24:MI:SS'),
+            'product_sku', coalesce(p.sku, ''),
+            'action_type', a.action_type,
+            'reason', coalesce(a.reason, ''),
+            'success', a.success
+        )), '[]'::json)
+         FROM (
+            SELECT * FROM action_logs ORDER BY created_at DESC LIMIT 100
+         ) a
+         LEFT JOIN products p ON p.id = a.product_id)
+""")
+
+# Column order of the sheets export statements below; zipping these
+# with the row tuples builds each dict in one C-level call instead of
+# eight keyed assignments per row
+_PRODUCT_KEYS = ("sku", "name", "status", "score", "ml_item_id",
+                 "price", "margin", "updated_at")
+_ACTION_KEYS = ("created_at", "product_sku", "action_type", "reason",
+                "success")
+
+def _job_guard(name: str):
+    """Log and swallow job failures with a traceback.
+
+    One decorator instead of the same try/except in every job body;
+    a failed run never propagates into APScheduler or kills the
+    trigger.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                logger.exception("Error in %s", name)
+        return wrapper
+    return deco
 
 class JobScheduler:
     """Manage scheduled jobs"""
     
     def __init__(self):
-        self.scheduler = AsyncIOScheduler()
+        # coalesce + misfire_grace_time collapse runs missed while the
+        # loop was busy into one execution; max_instances=1 keeps a
+        # slow sync from overlapping its next trigger and piling up
+        # DB sessions
+        self.scheduler = AsyncIOScheduler(job_defaults={
+            "coalesce": True,
+            "max_instances": 1,
+            "misfire_grace_time": 300
+        })
+        # Throttles the token-refresh failure alert (the job itself
+        # retries every minute)
+        self._last_token_alert = 0.0
         self._setup_jobs()
     
     def _setup_jobs(self):
@@ -76,167 +143,187 @@ class JobScheduler:
             replace_existing=True
         )
         
-        # Refresh ML token - every 5 hours
+        # Refresh ML token - checked every minute, refreshed only when
+        # it is within 10 minutes of expiring. The old 5-hour interval
+        # could leave an expired token live for hours if one refresh
+        # failed or the expiry came in under the interval
         self.scheduler.add_job(
             func=self.refresh_ml_token_job,
-            trigger=IntervalTrigger(hours=5),
+            trigger=IntervalTrigger(minutes=1),
             id='refresh_token',
             name='Refresh ML token',
             replace_existing=True
         )
     
+    @_job_guard("stock sync job")
     async def sync_stock_job(self):
         """Sync stock between Shopify and ML"""
-        try:
-            logger.info("Starting stock sync job")
-            db = SessionLocal()
-            
-            products = db.query(Product).filter(
-                Product.status == "published",
-                Product.shopify_product_id.isnot(None)
-            ).all()
-            
+        logger.info("Starting stock sync job")
+
+        with SessionLocal() as db:
+            # The ORM query blocks; run it off the loop so other
+            # jobs and in-flight HTTP awaits keep moving
+            product_ids = await asyncio.to_thread(
+                lambda: [
+                    pid for (pid,) in db.query(Product.id).filter(
+                        Product.status == "published",
+                        Product.shopify_product_id.isnot(None)
+                    ).all()
+                ]
+            )
+
             manager = ProductManager(db)
-            
-            for product in products:
-                await manager.sync_stock_with_shopify(product.id)
-            
-            db.close()
-            logger.info(f"Stock sync completed: {len(products)} products")
-            
-        except Exception as e:
-            logger.error(f"Error in stock sync job: {str(e)}")
+            await manager.bulk_sync_stock(product_ids)
+
+        logger.info("Stock sync completed: %d products", len(product_ids))
     
+    @_job_guard("metrics job")
     async def monitor_metrics_job(self):
         """Monitor product metrics"""
-        try:
-            logger.info("Starting metrics monitoring")
-            # TODO: Implement metrics fetching from ML API
-            logger.info("Metrics monitoring completed")
-            
-        except Exception as e:
-            logger.error(f"Error in metrics job: {str(e)}")
+        logger.info("Starting metrics monitoring")
+        # TODO: Implement metrics fetching from ML API
+        logger.info("Metrics monitoring completed")
     
+    @_job_guard("optimization job")
     async def optimize_products_job(self):
         """Optimize all products"""
-        try:
-            logger.info("Starting optimization job")
-            db = SessionLocal()
-            
+        logger.info("Starting optimization job")
+
+        with SessionLocal() as db:
             optimizer = PerformanceOptimizer(db)
             await optimizer.optimize_all_products()
-            
-            db.close()
-            logger.info("Optimization job completed")
-            
-        except Exception as e:
-            logger.error(f"Error in optimization job: {str(e)}")
+
+        logger.info("Optimization job completed")
     
+    @_job_guard("A/B test job")
     async def evaluate_ab_tests_job(self):
         """Evaluate running A/B tests"""
-        try:
-            logger.info("Starting A/B test evaluation")
-            db = SessionLocal()
-            
-            from database.models import ABTest
-            tests = db.query(ABTest).filter(ABTest.status == "running").all()
-            
-            manager = ABTestManager(db)
-            
-            for test in tests:
-                manager.evaluate_test(test.id)
-            
-            db.close()
-            logger.info(f"A/B evaluation completed: {len(tests)} tests")
-            
-        except Exception as e:
-            logger.error(f"Error in A/B test job: {str(e)}")
+        logger.info("Starting A/B test evaluation")
+
+        # Fully synchronous (queries + evaluation), so the whole
+        # body moves to a worker thread in one piece. The batched
+        # sweep eager-loads every running test in one query and
+        # commits once, instead of re-querying per test
+        def _evaluate() -> int:
+            with SessionLocal() as db:
+                manager = ABTestManager(db)
+                return len(manager.evaluate_all_running_tests())
+
+        count = await asyncio.to_thread(_evaluate)
+        logger.info("A/B evaluation completed: %d tests", count)
     
+    @_job_guard("sheets sync job")
     async def update_sheets_job(self):
         """Update Google Sheets"""
-        try:
-            if not sheets_api:
-                return
-            
-            logger.info("Starting Google Sheets sync")
-            db = SessionLocal()
-            
-            # Get products
-            products = db.query(Product).all()
-            product_data = [
-                {
-                    "sku": p.sku,
-                    "name": p.name,
-                    "status": p.status,
-                    "score": p.score,
-                    "ml_item_id": p.ml_item_id or "",
-                    "price": p.final_price or 0,
-                    "margin": p.margin_percentage or 0,
-                    "updated_at": p.updated_at.isoformat()
-                }
-                for p in products
-            ]
-            
-            # Get recent actions
-            from database.models import ActionLog
-            actions = db.query(ActionLog).order_by(
-                ActionLog.created_at.desc()
-            ).limit(100).all()
-            
-            action_data = [
-                {
-                    "created_at": a.created_at.isoformat(),
-                    "product_sku": db.query(Product).filter(Product.id == a.product_id).first().sku if a.product_id else "",
-                    "action_type": a.action_type,
-                    "reason": a.reason or "",
-                    "success": a.success
-                }
-                for a in actions
-            ]
-            
-            sheets_api.sync_all(product_data, action_data)
-            
-            db.close()
-            logger.info("Google Sheets sync completed")
-            
-        except Exception as e:
-            logger.error(f"Error in sheets sync job: {str(e)}")
+        if not sheets_api:
+            return
+
+        logger.info("Starting Google Sheets sync")
+
+        # Queries plus row serialization are blocking; collect the
+        # payload on a worker thread, then enqueue from the loop
+        def _collect():
+            with SessionLocal() as db:
+                if _IS_POSTGRES:
+                    return tuple(db.execute(_SHEETS_EXPORT_SQL).one())
+
+                # Column select streamed with yield_per: no ORM
+                # instances or identity map, and memory stays
+                # bounded by the batch instead of the whole table.
+                # The ''/0 fallbacks are coalesced in SQL so rows
+                # arrive export-ready
+                stmt = select(
+                    Product.sku, Product.name, Product.status,
+                    Product.score,
+                    func.coalesce(Product.ml_item_id, ""),
+                    func.coalesce(Product.final_price, 0),
+                    func.coalesce(Product.margin_percentage, 0),
+                    Product.updated_at
+                ).execution_options(yield_per=1000)
+
+                product_data = [
+                    dict(zip(_PRODUCT_KEYS,
+                             (*row[:7], row[7].isoformat())))
+                    for row in db.execute(stmt)
+                ]
+
+                # Recent actions as column tuples, like the product
+                # export: the SKU comes from the outer join (one
+                # query, no per-action lookup) and no ActionLog
+                # instances are built just to read four fields
+                from database.models import ActionLog
+                actions_stmt = (
+                    select(
+                        ActionLog.created_at,
+                        func.coalesce(Product.sku, ""),
+                        ActionLog.action_type,
+                        func.coalesce(ActionLog.reason, ""),
+                        ActionLog.success
+                    )
+                    .outerjoin(Product, Product.id == ActionLog.product_id)
+                    .order_by(ActionLog.created_at.desc())
+                    .limit(100)
+                )
+
+                action_data = [
+                    dict(zip(_ACTION_KEYS,
+                             (row[0].isoformat(), *row[1:])))
+                    for row in db.execute(actions_stmt)
+                ]
+
+                return product_data, action_data
+
+        product_data, action_data = await asyncio.to_thread(_collect)
+
+        await sheets_queue.enqueue(product_data, action_data)
+
+        logger.info("Google Sheets sync queued")
     
+    @_job_guard("auto-publish job")
     async def publish_approved_job(self):
         """Publish auto-approved products"""
-        try:
-            logger.info("Starting auto-publish job")
-            db = SessionLocal()
-            
-            products = db.query(Product).filter(
-                Product.status == "approved",
-                Product.auto_approved == True,
-                Product.ml_item_id.is_(None)
-            ).all()
-            
+        logger.info("Starting auto-publish job")
+
+        with SessionLocal() as db:
+            product_ids = await asyncio.to_thread(
+                lambda: [
+                    pid for (pid,) in db.query(Product.id).filter(
+                        Product.status == "approved",
+                        Product.auto_approved == True,
+                        Product.ml_item_id.is_(None)
+                    ).all()
+                ]
+            )
+
             manager = ProductManager(db)
-            
-            for product in products:
-                await manager.publish_to_ml(product.id)
-            
-            db.close()
-            logger.info(f"Auto-publish completed: {len(products)} products")
-            
-        except Exception as e:
-            logger.error(f"Error in auto-publish job: {str(e)}")
+            await manager.bulk_publish_to_ml(product_ids)
+
+        logger.info("Auto-publish completed: %d products", len(product_ids))
     
     async def refresh_ml_token_job(self):
-        """Refresh Mercado Libre access token"""
+        """Refresh the ML access token when it nears expiry.
+
+        Runs every minute but returns silently while the token has
+        comfortable life left, so the refresh lands proactively instead
+        of up to 5 hours after expiry. Failure alerts are throttled to
+        one per hour since the job retries on the next tick anyway.
+        """
         try:
+            if not ml_api.needs_refresh():
+                return
+
             logger.info("Refreshing ML token")
             success = await ml_api.refresh_token()
-            
-            if not success:
+
+            if not success and time.time() - self._last_token_alert > 3600:
+                self._last_token_alert = time.time()
                 notify_error("ML Token Refresh Failed", "Check credentials")
-            
+
         except Exception as e:
-            logger.error(f"Error refreshing token: {str(e)}")
-            notify_error("ML Token Refresh Error", str(e))
+            logger.exception("Error refreshing token")
+            if time.time() - self._last_token_alert > 3600:
+                self._last_token_alert = time.time()
+                notify_error("ML Token Refresh Error", str(e))
     
     def start(self):
         """Start the scheduler"""
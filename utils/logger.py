@@ -1,54 +1,77 @@
+import atexit
 import logging
-import os
-from datetime import datetime
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 
 # Create logs directory
 LOG_DIR = Path("logs")
 LOG_DIR.mkdir(exist_ok=True)
 
+# Listener draining the log queue onto the real handlers; stopped via
+# atexit so buffered records are flushed on shutdown
+_listener = None
+
 # Configure logging
 def setup_logger(name: str = "ml_automation") -> logging.Logger:
-    """Setup logger with file and console handlers"""
-    
+    """Setup logger with queued console and file handlers.
+
+    The logger itself only holds a QueueHandler, so a log call from an
+    async job is a lock-free put instead of a blocking file write; a
+    background QueueListener thread fans records out to the console and
+    the two rotating file handlers.
+    """
+    global _listener
+
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    
+
     # Avoid duplicate handlers
     if logger.handlers:
         return logger
-    
+
     # Format
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
+
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler - general log
-    today = datetime.now().strftime("%Y-%m-%d")
-    file_handler = logging.FileHandler(
-        LOG_DIR / f"ml_automation_{today}.log",
+
+    # File handler - general log, rotated at midnight so one process
+    # does not keep writing yesterday's file
+    file_handler = TimedRotatingFileHandler(
+        LOG_DIR / "ml_automation.log",
+        when="midnight",
+        backupCount=14,
         encoding='utf-8'
     )
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
+
     # File handler - errors only
-    error_handler = logging.FileHandler(
-        LOG_DIR / f"errors_{today}.log",
+    error_handler = TimedRotatingFileHandler(
+        LOG_DIR / "errors.log",
+        when="midnight",
+        backupCount=14,
         encoding='utf-8'
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
-    
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(
+        log_queue, console_handler, file_handler, error_handler,
+        respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
     return logger
 
 # Global logger
@@ -1,75 +1,140 @@
+import asyncio
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import List, Optional
 from config.settings import get_settings
 from utils.logger import logger
 
 settings = get_settings()
 
+# One SMTP connection per process, reused across notifications: the
+# TCP + STARTTLS + LOGIN exchange costs several round trips, which
+# dominates send time when error storms fire many notifications
+_smtp_lock = threading.Lock()
+_smtp_client: Optional[smtplib.SMTP] = None
+
+def _connect() -> smtplib.SMTP:
+    """Open, upgrade and authenticate a fresh SMTP connection"""
+    server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT)
+    server.starttls()
+    server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    return server
+
+def _get_client() -> smtplib.SMTP:
+    """Get the shared SMTP connection, reconnecting if it went stale.
+
+    Caller must hold _smtp_lock.
+    """
+    global _smtp_client
+
+    if _smtp_client is not None:
+        try:
+            _smtp_client.noop()
+            return _smtp_client
+        except Exception:
+            # Idle timeout or server-side close; fall through and redial
+            try:
+                _smtp_client.close()
+            except Exception:
+                pass
+            _smtp_client = None
+
+    _smtp_client = _connect()
+    return _smtp_client
+
+def _build_message(subject: str, body: str, to_email: str) -> MIMEMultipart:
+    """Build a plain-text notification message"""
+    msg = MIMEMultipart()
+    msg['From'] = settings.SMTP_USER
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+def _send_blocking(msg: MIMEMultipart, subject: str) -> bool:
+    """Deliver a message over the shared connection (blocking)"""
+    try:
+        with _smtp_lock:
+            _get_client().send_message(msg)
+
+        logger.info("Email sent: %s", subject)
+        return True
+
+    except Exception:
+        logger.exception("Error sending email")
+        return False
+
 def send_email(subject: str, body: str, to_email: str = None):
-    """Send email notification"""
-    
+    """Send email notification over the shared SMTP connection.
+
+    Inside a running event loop (scheduler jobs, async handlers) the
+    blocking SMTP I/O is handed to the executor and this returns
+    immediately, so the loop never stalls on the send; failures are
+    logged by the worker. Outside a loop it sends inline.
+    """
+
     if not to_email:
         to_email = settings.NOTIFICATION_EMAIL
-    
+
+    msg = _build_message(subject, body, to_email)
+
     try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = settings.SMTP_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add body
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Connect and send
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            server.starttls()
-            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.send_message(msg)
-        
-        logger.info(f"Email sent: {subject}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error sending email: {str(e)}")
-        return False
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _send_blocking(msg, subject)
 
-def notify_product_published(product_name: str, ml_item_id: str, score: int):
-    """Notify when product is auto-published"""
-    subject = f"✅ Producto Publicado: {product_name}"
-    body = f"""
+    loop.run_in_executor(None, _send_blocking, msg, subject)
+    return True
+
+def send_emails_bulk(messages: List[tuple]) -> int:
+    """Send many (subject, body) notifications in one SMTP session.
+
+    Returns the number of messages sent successfully.
+    """
+    sent = 0
+
+    with _smtp_lock:
+        for subject, body in messages:
+            try:
+                msg = _build_message(subject, body, settings.NOTIFICATION_EMAIL)
+                _get_client().send_message(msg)
+                sent += 1
+            except Exception:
+                logger.exception("Error sending email")
+
+    if sent:
+        logger.info("Sent %d/%d emails in bulk", sent, len(messages))
+    return sent
+
+# Notification bodies as module-level templates: built once at import
+# and filled with .format() per call instead of re-assembling the
+# multiline literal every time
+_TPL_PUBLISHED = """
 Producto publicado automáticamente en Mercado Libre
 
-Producto: {product_name}
+Producto: {name}
 ML Item ID: {ml_item_id}
 Score: {score}/100
 
 El producto fue publicado automáticamente por tener un score alto.
     """
-    send_email(subject, body)
 
-def notify_optimization(action: str, product_name: str, details: str):
-    """Notify optimization actions"""
-    subject = f"⚙️ Optimización: {action}"
-    body = f"""
+_TPL_OPTIMIZATION = """
 Acción de optimización ejecutada
 
 Acción: {action}
-Producto: {product_name}
+Producto: {name}
 Detalles: {details}
 
 Esta acción fue ejecutada automáticamente por el sistema.
     """
-    send_email(subject, body)
 
-def notify_ab_test_completed(product_name: str, winner: str, results: dict):
-    """Notify when A/B test completes"""
-    subject = f"🏆 Test A/B Completado: {product_name}"
-    body = f"""
+_TPL_AB_COMPLETED = """
 Test A/B completado
 
-Producto: {product_name}
+Producto: {name}
 Ganador: Variante {winner}
 
 Resultados:
@@ -77,12 +142,8 @@ Resultados:
 
 El sistema pausará automáticamente la variante perdedora.
     """
-    send_email(subject, body)
 
-def notify_error(error_type: str, error_message: str):
-    """Notify critical errors"""
-    subject = f"❌ Error Crítico: {error_type}"
-    body = f"""
+_TPL_ERROR = """
 Error crítico en el sistema
 
 Tipo: {error_type}
@@ -90,4 +151,35 @@ Mensaje: {error_message}
 
 Revisa los logs para más detalles.
     """
+
+def notify_product_published(product_name: str, ml_item_id: str, score: int):
+    """Notify when product is auto-published"""
+    subject = f"✅ Producto Publicado: {product_name}"
+    body = _TPL_PUBLISHED.format(
+        name=product_name, ml_item_id=ml_item_id, score=score
+    )
+    send_email(subject, body)
+
+def notify_optimization(action: str, product_name: str, details: str):
+    """Notify optimization actions"""
+    subject = f"⚙️ Optimización: {action}"
+    body = _TPL_OPTIMIZATION.format(
+        action=action, name=product_name, details=details
+    )
+    send_email(subject, body)
+
+def notify_ab_test_completed(product_name: str, winner: str, results: dict):
+    """Notify when A/B test completes"""
+    subject = f"🏆 Test A/B Completado: {product_name}"
+    body = _TPL_AB_COMPLETED.format(
+        name=product_name, winner=winner, results=results
+    )
+    send_email(subject, body)
+
+def notify_error(error_type: str, error_message: str):
+    """Notify critical errors"""
+    subject = f"❌ Error Crítico: {error_type}"
+    body = _TPL_ERROR.format(
+        error_type=error_type, error_message=error_message
+    )
     send_email(subject, body)